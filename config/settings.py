@@ -35,6 +35,8 @@ SECRET_KEY = env('DJANGO_SECRET_KEY',default=get_random_secret_key())
 GOOGLE_MAPS_API_KEY = env('GOOGLE_MAPS_API_KEY',default=None)
 TRANSACTION_INDEX_NAME = env('TRANSACTION_INDEX_NAME',default='search-bank-project-transactions_v1')
 TRANSACTION_PIPELINE_NAME = env('TRANSACTION_PIPELINE_NAME',default='ml-inference-search-bank-project-transactions_v1')
+TRANSACTION_PAGE_SIZE = env.int('TRANSACTION_PAGE_SIZE',default=50)
+TRANSACTION_SEARCH_BACKEND = env('TRANSACTION_SEARCH_BACKEND',default='database')
 KNOWLEDGE_BASE_PIPELINE_NAME = env('KNOWLEDGE_BASE_PIPELINE_NAME',default='ml-inference-knowledge-base')
 MODEL_ID = env('TRANSFORMER_MODEL',default='.elser_model_2_linux-x86_64')
 TRANSFORMER_MODEL = MODEL_ID
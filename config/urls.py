@@ -16,7 +16,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 from public.views import home
-from onlinebanking.views import landing, transactions, search, financial_analysis, customer_support
+from onlinebanking.views import landing, transactions, statement, search, financial_analysis, customer_support
 from envmanager.views import manager, clear_data, generate_data, process_data_action, execute_backend_command, cluster, export_data, index_setup, demo_scenarios, banking_products, knowledge_base, eland_action
 
 from django.conf.urls.static import static
@@ -28,6 +28,7 @@ urlpatterns = [
     path('', home, name='home'),
     path('onlinebanking/', landing, name='landing'),
     path('onlinebanking/transactions/<int:bank_account_id>', transactions, name='transactions'),
+    path('onlinebanking/statement/<int:bank_account_id>', statement, name='statement'),
     path('onlinebanking/search', search, name='search'),
     path('onlinebanking/financial_analysis', financial_analysis, name='financial_analysis'),
     path('onlinebanking/customer_support', customer_support, name='customer_support'),
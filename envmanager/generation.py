@@ -0,0 +1,431 @@
+import csv
+import io
+import json
+import os
+import random
+import resource
+import uuid
+from datetime import datetime, time, timezone
+
+import numpy as np
+import random_address
+from config.settings import BASE_DIR
+from django.db import connection, transaction
+
+from onlinebanking.models import BankAccount, AccountTransaction, AccountTransactionType, TransactionCategory, \
+    Retailer
+from onlinebanking.posting import lock_accounts
+from onlinebanking.summaries import update_summaries
+
+
+ADDRESS_FILE = os.path.join(os.path.dirname(random_address.__file__), 'addresses-us-all.min.json')
+DEFAULT_CITY = 'San Francisco'
+RETAILER_FILE = BASE_DIR / 'files/cos2019.csv'
+PAYDAY_INTERVAL = 30
+# seeded runs count their dates back from here unless --as-of is given, so a seed always gives the same dataset
+SEED_REFERENCE_DATE = datetime(2025, 1, 1, tzinfo=timezone.utc)
+TRANSFER_PROBABILITY = 0.01
+
+# kinds of planned transactions
+PAYDAY = 0
+PAYMENT = 1
+TRANSFER = 2
+PURCHASE = 3
+
+
+_retailers = None
+_uuid_random = None
+
+
+def seed_random_sources(seed, *providers):
+    """
+    Seeds random, the given mimesis providers and UUID generation with seed, and returns a NumPy Generator
+    seeded the same way. With the same seed and arguments the generators write the same dataset, a seed
+    of None puts every source back on fresh entropy.
+    """
+    global _uuid_random
+    random.seed(seed)
+    for provider in providers:
+        provider.reseed(seed)
+    _uuid_random = random.Random(seed) if seed is not None else None
+    return np.random.default_rng(seed)
+
+
+def reference_time(as_of=None, seed=None):
+    """
+    The moment generated dates are counted back from: midnight UTC of the as_of date when one is given,
+    SEED_REFERENCE_DATE for a seeded run and the current time otherwise.
+    """
+    if as_of is not None:
+        return datetime.combine(as_of, time(), tzinfo=timezone.utc)
+    if seed is not None:
+        return SEED_REFERENCE_DATE
+    return datetime.now(tz=timezone.utc)
+
+
+def new_uuid():
+    """A version 4 UUID, drawn from the seeded generator once seed_random_sources has been called."""
+    if _uuid_random is None:
+        return uuid.uuid4()
+    return uuid.UUID(int=_uuid_random.getrandbits(128), version=4)
+
+
+def peak_memory_mb(who=resource.RUSAGE_SELF):
+    """High-water mark of the resident set size in MB, of this process or of its finished children."""
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def import_retailers(file_path=RETAILER_FILE):
+    """Upserts the retailers listed in the CSV file in one statement, keyed on the retailer name."""
+    with open(file_path, newline='') as csvfile:
+        reader = csv.DictReader(csvfile, delimiter=';')
+        rows = {row['name']: row['dominant_operational_format'] for row in reader}
+    Retailer.objects.bulk_create(
+        [Retailer(name=name, dominant_operational_format=retail_format) for name, retail_format in rows.items()],
+        update_conflicts=True,
+        unique_fields=['name'],
+        update_fields=['dominant_operational_format']
+    )
+    retailers(reload=True)
+
+
+def retailers(reload=False):
+    """Returns every Retailer, loaded once per process and again when reload is set."""
+    global _retailers
+    if _retailers is None or reload:
+        _retailers = list(Retailer.objects.order_by('id'))
+    return _retailers
+
+
+def copy_value(field, obj):
+    value = field.get_db_prep_save(field.pre_save(obj, add=True), connection)
+    return '\\N' if value is None else value
+
+
+def load_rows(model, objects, batch_size=5000):
+    """
+    Inserts unsaved model instances and sets their primary keys, so the next set of rows can reference
+    them. On PostgreSQL the ids are reserved from the table's sequence and the rows are streamed in with
+    COPY in batches of batch_size, other databases fall back to bulk_create. Call it inside
+    transaction.atomic.
+    """
+    if not objects:
+        return
+    if connection.vendor != 'postgresql':
+        model.objects.bulk_create(objects, batch_size=batch_size)
+        return
+
+    table = model._meta.db_table
+    fields = model._meta.concrete_fields
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    copy_sql = f"COPY {connection.ops.quote_name(table)} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+                       [table, model._meta.pk.column, len(objects)])
+        for obj, (pk,) in zip(objects, cursor.fetchall()):
+            obj.pk = pk
+        for start in range(0, len(objects), batch_size):
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for obj in objects[start:start + batch_size]:
+                writer.writerow([copy_value(field, obj) for field in fields])
+            buffer.seek(0)
+            cursor.copy_expert(copy_sql, buffer)
+    for obj in objects:
+        obj._state.adding = False
+        obj._state.db = connection.alias
+
+
+class AccountIndex:
+    """Bank accounts of one customer, split the way the generators pick them."""
+    __slots__ = ('all', 'transactional', 'transmission')
+
+    def __init__(self):
+        self.all = []
+        self.transactional = []
+        self.transmission = []
+
+    def add(self, bank_account):
+        self.all.append(bank_account)
+        if bank_account.account_type.transactional:
+            self.transactional.append(bank_account)
+        if bank_account.account_type.account_type == 'Transmission':
+            self.transmission.append(bank_account)
+
+    def other(self, bank_account):
+        """Returns a random account of the same customer other than bank_account, or None."""
+        others = [b for b in self.all if b.id != bank_account.id]
+        return random.choice(others) if others else None
+
+
+def build_account_index(customer_ids=None):
+    """Loads the bank accounts of the given customers (all customers by default) in one query."""
+    bank_accounts = BankAccount.objects.select_related('account_type', 'customer').order_by('id')
+    if customer_ids is not None:
+        bank_accounts = bank_accounts.filter(customer_id__in=customer_ids)
+    account_index = {}
+    for bank_account in bank_accounts:
+        account_index.setdefault(bank_account.customer_id, AccountIndex()).add(bank_account)
+    return account_index
+
+
+class AccountState:
+    """
+    Running position of one bank account while a dataset is being generated. stored_sequence is the
+    sequence the account row had when it was last read or written by the ledger.
+    """
+    __slots__ = ('bank_account', 'balance', 'sequence', 'stored_sequence')
+
+    def __init__(self, bank_account, balance=0, sequence=0):
+        self.bank_account = bank_account
+        self.balance = balance
+        self.sequence = sequence
+        self.stored_sequence = sequence
+
+
+class AddressPool:
+    """
+    The random_address dataset loaded once into columns of NumPy arrays. Addresses are sampled by index
+    with the random module, so seeding random makes the sampled addresses repeatable.
+    """
+
+    def __init__(self, file_path=ADDRESS_FILE):
+        with open(file_path) as address_file:
+            addresses = json.load(address_file)['addresses']
+        self.address_line_one = np.array([a['address1'] for a in addresses])
+        self.address_line_two = np.array([a['address2'] for a in addresses])
+        self.city = np.array([a.get('city', DEFAULT_CITY) for a in addresses])
+        self.state = np.array([a['state'] for a in addresses])
+        self.postal_code = np.array([a['postalCode'] for a in addresses])
+        self.latitude = np.array([a['coordinates']['lat'] for a in addresses])
+        self.longitude = np.array([a['coordinates']['lng'] for a in addresses])
+        self.size = len(addresses)
+
+    def sample(self):
+        return random.randrange(self.size)
+
+    def address(self, index=None, with_coordinates=True):
+        """
+        Returns an address in the layout of random_address.real_random_address(), a random one unless
+        index is given. The coordinates are the ones shipped with the dataset, so purchases located at
+        the address need no geocoding.
+        """
+        if index is None:
+            index = self.sample()
+        address = {
+            'address1': str(self.address_line_one[index]),
+            'address2': str(self.address_line_two[index]),
+            'city': str(self.city[index]),
+            'state': str(self.state[index]),
+            'postalCode': str(self.postal_code[index])
+        }
+        if with_coordinates:
+            address['coordinates'] = {'lat': float(self.latitude[index]), 'lng': float(self.longitude[index])}
+        return address
+
+
+_address_pool = None
+
+
+def address_pool():
+    """Returns the process wide AddressPool, loading it on first use."""
+    global _address_pool
+    if _address_pool is None:
+        _address_pool = AddressPool()
+    return _address_pool
+
+
+class Ledger:
+    """
+    In-memory ledger used by the dataset generators.
+
+    Transaction types, categories and retailers are loaded once, balances are kept per account in
+    AccountState objects, and transactions are written with load_rows in batches of batch_size inside
+    transaction.atomic. Call flush() once generation is done to write the last partial batch.
+
+    writer replaces the database insert, it is called with each batch of unsaved AccountTransaction
+    objects and returns how many of them it wrote.
+
+    The default writer takes the accounts' row locks and raises RuntimeError, stopping the whole run,
+    when an account was posted to (e.g. from the web app) since the ledger last read or wrote it.
+    Databases without SELECT ... FOR UPDATE skip that check.
+    """
+
+    def __init__(self, batch_size=5000, writer=None):
+        self.batch_size = batch_size
+        self.writer = writer or self.bulk_insert
+        self.transaction_types = {t.transaction_type: t for t in AccountTransactionType.objects.all()}
+        self.categories = {c.category_name: c for c in TransactionCategory.objects.all()}
+        self.retailers = retailers()
+        self.accounts = {}
+        self.changed = set()
+        self.pending = []
+        self.written_count = 0
+
+    def track(self, bank_accounts):
+        """Loads the current balance and sequence of several accounts in one query."""
+        bank_accounts = [b for b in bank_accounts if b.id not in self.accounts]
+        if not bank_accounts:
+            return
+        balances = {account_id: (current_balance, sequence) for account_id, current_balance, sequence in
+                    BankAccount.objects.filter(id__in=[b.id for b in bank_accounts]).values_list(
+                        'id', 'current_balance', 'sequence')}
+        for bank_account in bank_accounts:
+            self.accounts[bank_account.id] = AccountState(bank_account, *balances.get(bank_account.id, (0, 0)))
+
+    def state(self, bank_account):
+        if bank_account.id not in self.accounts:
+            self.track([bank_account])
+        return self.accounts[bank_account.id]
+
+    def balance(self, bank_account):
+        return self.state(bank_account).balance
+
+    def post(self, bank_account, transaction_type, category_name, transaction_value, description,
+             transaction_date, opening_balance=None, **fields):
+        """
+        Queues a transaction and moves the account balance. opening_balance only applies to accounts
+        without any transaction yet, it mirrors the random starting balance given to first purchases.
+        """
+        state = self.state(bank_account)
+        transaction_type = self.transaction_types[transaction_type]
+        if state.sequence or opening_balance is None:
+            opening_balance = state.balance
+        if transaction_type.transaction_operator == '-':
+            closing_balance = opening_balance - transaction_value
+        else:
+            closing_balance = opening_balance + transaction_value
+        state.balance = closing_balance
+        state.sequence = state.sequence + 1
+        self.changed.add(bank_account.id)
+
+        self.pending.append(AccountTransaction(
+            reference=new_uuid(),
+            bank_account=bank_account,
+            transaction_type=transaction_type,
+            transaction_category=self.categories[category_name],
+            opening_balance=opening_balance,
+            transaction_value=transaction_value,
+            closing_balance=closing_balance,
+            description=description,
+            transaction_date=transaction_date,
+            **fields
+        ))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def bulk_insert(self, transactions):
+        # the accounts' current_balance, sequence and monthly summaries move in the same database
+        # transaction as the rows, under the same row locks the posting service takes
+        with transaction.atomic():
+            # without row locks (SQLite) a read here would start a read transaction that can't be upgraded
+            # while another shard writes, the database-wide write lock keeps postings out there anyway
+            if connection.features.has_select_for_update:
+                self.check_sequences(lock_accounts(*self.changed))
+            load_rows(AccountTransaction, transactions, batch_size=self.batch_size)
+            update_summaries(transactions)
+            BankAccount.objects.bulk_update(
+                [BankAccount(id=account_id, current_balance=self.accounts[account_id].balance,
+                             sequence=self.accounts[account_id].sequence) for account_id in self.changed],
+                ['current_balance', 'sequence'], batch_size=self.batch_size)
+        for account_id in self.changed:
+            self.accounts[account_id].stored_sequence = self.accounts[account_id].sequence
+        return len(transactions)
+
+    def check_sequences(self, locked):
+        moved = sorted(account_id for account_id in self.changed
+                       if account_id not in locked or
+                       locked[account_id].sequence != self.accounts[account_id].stored_sequence)
+        if moved:
+            raise RuntimeError(f'Bank accounts {moved} were posted to while the dataset was being generated, '
+                               f'their balances would be overwritten')
+
+    def flush(self):
+        if not self.pending:
+            return
+        self.written_count = self.written_count + self.writer(self.pending)
+        self.pending = []
+        self.changed = set()
+
+    def release(self):
+        """Writes what is pending and drops the account states, so memory does not grow with each chunk."""
+        self.flush()
+        self.accounts = {}
+
+
+def plan_transactions(rng, number_of_days, transaction_minimum, transaction_maximum, category_names,
+                      category_weights, is_wealthy=False):
+    """
+    Plans every transaction of one customer over number_of_days with NumPy instead of per-transaction
+    random calls. Returns (day, kind, value) arrays in posting order: each day draws between
+    transaction_minimum and transaction_maximum transactions, the first one on a payday is a salary
+    credit and the others follow the category weights, with 1% of non-purchases being transfers.
+    """
+    counts = rng.integers(transaction_minimum, transaction_maximum + 1, size=number_of_days)
+    day = np.repeat(np.arange(number_of_days), counts)
+    position = np.arange(day.size) - np.repeat(np.cumsum(counts) - counts, counts)
+    payday = (day % PAYDAY_INTERVAL == 0) & (position == 0)
+
+    weights = np.asarray(category_weights, dtype=float)
+    category = rng.choice(len(category_names), size=day.size, p=weights / weights.sum())
+    purchase = np.asarray(category_names)[category] == 'Purchase'
+    transfer = rng.random(day.size) < TRANSFER_PROBABILITY
+    kind = np.select([payday, purchase, transfer], [PAYDAY, PURCHASE, TRANSFER], default=PAYMENT)
+
+    if is_wealthy:
+        salary = rng.integers(10000, 50001, size=day.size)
+    else:
+        salary = rng.integers(1500, 8001, size=day.size)
+    value = np.select(
+        [kind == PAYDAY, kind == PURCHASE, kind == TRANSFER],
+        [salary, rng.integers(10, 201, size=day.size), rng.integers(200, 801, size=day.size)],
+        default=rng.integers(50, 1001, size=day.size)
+    )
+    return day, kind, value
+
+
+def plan_accounts(rng, kind, transmission, transactional, number_of_accounts):
+    """
+    Picks the account (and the receiving account of transfers) of each planned transaction as indexes
+    into the customer's accounts. Salaries land on a Transmission account, purchases on a transactional
+    account and everything else on any account. Transactions without a suitable account are -1.
+    """
+    account = rng.integers(0, number_of_accounts, size=kind.size)
+    for kind_value, candidates in ((PAYDAY, transmission), (PURCHASE, transactional)):
+        selected = kind == kind_value
+        if candidates:
+            account[selected] = np.asarray(candidates)[rng.integers(0, len(candidates), size=selected.sum())]
+        else:
+            account[selected] = -1
+    # transfers go to one of the customer's other accounts
+    target = np.full(kind.size, -1)
+    if number_of_accounts > 1:
+        offset = rng.integers(1, number_of_accounts, size=kind.size)
+        target = np.where(kind == TRANSFER, (account + offset) % number_of_accounts, -1)
+    return account, target
+
+
+def affordable_purchases(kind, account, target, value, opening_balances):
+    """
+    Returns the mask of planned transactions to keep when purchases are skipped if the account would
+    not stay in credit. Balances are running sums of the signed values per account, the mask is
+    recomputed from them until it no longer changes: skipping a purchase only raises later balances, so
+    the iteration settles on the same result as checking every purchase one after the other.
+    """
+    number_of_accounts = len(opening_balances)
+    purchase = kind == PURCHASE
+    signed = np.where(kind == PAYDAY, value, -value).astype(float)
+    columns = np.arange(kind.size)
+    keep = np.ones(kind.size, dtype=bool)
+    while True:
+        deltas = np.zeros((number_of_accounts, kind.size))
+        deltas[account[keep], columns[keep]] = signed[keep]
+        transfers = keep & (target >= 0)
+        deltas[target[transfers], columns[transfers]] += value[transfers]
+        balances = np.cumsum(deltas, axis=1) + np.asarray(opening_balances, dtype=float)[:, None]
+        balance_before = balances[account, columns] - np.where(keep, signed, 0)
+        new_keep = ~purchase | (balance_before - value > 0)
+        if np.array_equal(new_keep, keep):
+            return keep
+        keep = new_keep
@@ -0,0 +1,134 @@
+"""
+Helpers shared by the commands that index transactions. Importing this module does not connect to
+Elasticsearch, commands that only touch the database can use it without any cluster configured.
+"""
+import re
+
+from elasticsearch import Elasticsearch
+
+from config import settings
+from onlinebanking.geocoding import geocode_many
+from onlinebanking.models import AccountTransaction, Retailer
+
+index_name = getattr(settings, 'TRANSACTION_INDEX_NAME', None)
+pipeline_name = getattr(settings, 'TRANSACTION_PIPELINE_NAME', None)
+elastic_cloud_id = getattr(settings, 'elastic_cloud_id', None)
+elastic_user = getattr(settings, 'elastic_user', None)
+elastic_password = getattr(settings, 'elastic_password', None)
+merchant_pattern = r"merchant: (.+?), location: (.+)$"
+
+_es = None
+
+
+def elasticsearch_client():
+    """Returns the process wide Elasticsearch client, creating it on first use."""
+    global _es
+    if _es is None:
+        _es = Elasticsearch(
+            cloud_id=elastic_cloud_id,
+            http_auth=(elastic_user, elastic_password),
+            request_timeout=None
+        )
+    return _es
+
+
+def parse_merchant(transaction_details):
+    # structured columns are written by the generators, older rows only carry the merchant in the description
+    if transaction_details.merchant_name:
+        return transaction_details.merchant_name, transaction_details.location
+    match = re.search(merchant_pattern, transaction_details.description)
+    if match:
+        return match.group(1), match.group(2)
+    return None, None
+
+
+def build_payload(transaction_details, retailers, coordinates):
+    bank_account_details = transaction_details.bank_account
+    customer_details = bank_account_details.customer
+
+    payload = {
+        "transaction_date": transaction_details.transaction_date.strftime("%Y-%m-%d"),
+        "bank_account_number": str(bank_account_details),
+        "bank_account_type": str(bank_account_details.account_type),
+        "transaction_category": transaction_details.transaction_category.category_name,
+        "transaction_type": transaction_details.transaction_type.transaction_type,
+        "opening_balance": transaction_details.opening_balance,
+        "transaction_value": transaction_details.transaction_value,
+        "closing_balance": transaction_details.closing_balance,
+        "description": transaction_details.description,
+        "customer_name": f'{customer_details.first_name} {customer_details.last_name}',
+        "customer_email": customer_details.email
+    }
+    merchant, location = parse_merchant(transaction_details)
+    if merchant:
+        if transaction_details.retailer_id:
+            retailer_format = transaction_details.retailer.dominant_operational_format
+        else:
+            retailer_format = retailers.get(merchant)
+        payload[
+            'description'] = f"{transaction_details.description} - retail category: {retailer_format}"
+        payload['merchant_name'] = merchant
+        payload['location'] = location
+        payload['retail_category'] = retailer_format
+
+        if transaction_details.latitude is not None:
+            geometry = (transaction_details.latitude, transaction_details.longitude)
+        else:
+            geometry = coordinates.get(location)
+        if geometry:
+            latitude, longitude = geometry
+            payload['geometry'] = {
+                "lat": latitude,
+                "lon": longitude
+            }
+    return payload
+
+
+def build_records(transactions):
+    # build the documents for a whole chunk of transactions from one joined query instead of
+    # fetching the account, customer, type, category and retailer of every row one at a time
+    transaction_ids = [t.id if isinstance(t, AccountTransaction) else t for t in transactions]
+    transaction_list = list(
+        AccountTransaction.objects.filter(id__in=transaction_ids)
+        .select_related('bank_account__account_type', 'bank_account__customer', 'transaction_type',
+                        'transaction_category', 'retailer')
+        .order_by('id')
+    )
+
+    # rows without the structured columns need their retailer and coordinates looked up
+    merchants = set()
+    locations = set()
+    for t in transaction_list:
+        merchant, location = parse_merchant(t)
+        if merchant and not t.retailer_id:
+            merchants.add(merchant)
+        if location and t.latitude is None:
+            locations.add(location)
+    retailers = {}
+    if merchants:
+        # keep the first retailer per name, the same row the per-record lookup used to pick
+        for name, retail_format in Retailer.objects.filter(name__in=merchants).order_by('-id').values_list(
+                'name', 'dominant_operational_format'):
+            retailers[name] = retail_format
+
+    coordinates = geocode_many(locations)
+    return [(t.id, build_payload(t, retailers, coordinates)) for t in transaction_list]
+
+
+def keyset_ids(queryset, chunk_size, last_id=0):
+    # keyset pagination over the primary key, rows that fail to index keep exported=False and are
+    # skipped for the rest of the run instead of being fetched again
+    while True:
+        ids = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            break
+        yield ids
+        last_id = ids[-1]
+
+
+def flag_exported(transaction_ids):
+    AccountTransaction.objects.filter(id__in=transaction_ids).update(exported=True)
+
+
+def backoff(attempt, initial_backoff, max_backoff):
+    return min(initial_backoff * 2 ** (attempt - 1), max_backoff)
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from onlinebanking.models import AccountTransaction, BankAccount
+
+
+def hot_queries(bank_account_id):
+    # the queries run per page view or per export chunk, with the index each one is expected to use
+    return [
+        ('latest balance', 'transaction_account_timestamp',
+         AccountTransaction.objects.filter(bank_account=bank_account_id).order_by('-timestamp')[:1]),
+        ('transaction list', 'transaction_account_date',
+         AccountTransaction.objects.filter(bank_account=bank_account_id).order_by('-transaction_date', '-id')[:51]),
+        ('export scan', 'transaction_unexported',
+         AccountTransaction.objects.filter(exported=False, id__gt=0).order_by('id').values_list('id', flat=True)[:500]),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Reports with EXPLAIN whether the hot AccountTransaction queries use their indexes'
+
+    def handle(self, *args, **kwargs):
+        bank_account = BankAccount.objects.order_by('id').first()
+        if not bank_account:
+            raise CommandError('No bank accounts to build the queries with, generate some data first.')
+
+        missing_count = 0
+        for query_name, index, queryset in hot_queries(bank_account.id):
+            plan = queryset.explain()
+            if index in plan:
+                self.stdout.write(self.style.SUCCESS(f'{query_name}: uses {index}'))
+            else:
+                missing_count = missing_count + 1
+                self.stdout.write(self.style.ERROR(f'{query_name}: does not use {index}'))
+            if kwargs['verbosity'] > 1 or index not in plan:
+                self.stdout.write(plan)
+
+        if missing_count:
+            # planners prefer a sequential scan on small tables, so only a loaded database gives a verdict
+            self.stdout.write(self.style.WARNING(
+                f'{missing_count} queries do not use their index on {connection.vendor}, '
+                f'{AccountTransaction.objects.count()} transactions in the table.'))
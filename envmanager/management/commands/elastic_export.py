@@ -1,146 +1,366 @@
-import os
-import googlemaps
-from elasticsearch import Elasticsearch
-from elasticsearch.helpers import bulk
-from onlinebanking.models import BankAccount, BankAccountType, AccountTransactionType, AccountTransaction, Customer, \
-    CustomerAddress, Retailer, BankingProducts
-from envmanager.models import ClusterDetail
-from django.core.management.base import BaseCommand
+import io
+import time
+from contextlib import contextmanager, nullcontext
+import zstandard
+from elasticsearch import ApiError, ConnectionError, ConnectionTimeout
+from elasticsearch.helpers import expand_action, parallel_bulk, streaming_bulk
+from onlinebanking.models import AccountTransaction, BankingProducts, TransactionOutbox
+from envmanager.indexing import backoff, build_records, elasticsearch_client, flag_exported, index_name, \
+    keyset_ids, pipeline_name
+from envmanager.models import ExportCheckpoint, ExportFailure
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 import json
-import re
 from config import settings
-from config.settings import GOOGLE_MAPS_API_KEY
 
-index_name = getattr(settings, 'TRANSACTION_INDEX_NAME', None)
 product_index_name = getattr(settings, 'PRODUCT_INDEX', None)
-pipeline_name = getattr(settings, 'TRANSACTION_PIPELINE_NAME', None)
-elastic_cloud_id = getattr(settings, 'elastic_cloud_id', None)
-elastic_user = getattr(settings, 'elastic_user', None)
-elastic_password = getattr(settings, 'elastic_password', None)
-
-es = Elasticsearch(
-    cloud_id=elastic_cloud_id,
-    http_auth=(elastic_user, elastic_password),
-    request_timeout=None
-)
-
-
-def build_product(product_id):
-    payload = {}
-    product_detail = BankingProducts.objects.filter(id=product_id).first()
-    payload = {
+product_pipeline_name = getattr(settings, 'PRODUCT_INDEX_PIPELINE_NAME', None)
+INDEX_SETTINGS_FILE = settings.BASE_DIR / 'files/transaction_index_settings.json'
+# bulk item statuses worth another attempt, anything else is a problem with the document itself
+TRANSIENT_STATUSES = (429, 502, 503, 504)
+
+
+def product_payload(product_detail):
+    return {
         "product_name": str(product_detail.product_name),
         "description": str(product_detail.description),
         "bank_account_type": product_detail.account_type.account_type
     }
-    payload = json.dumps(payload)
-    return payload
-
-
-def build_record(transaction_id):
-    payload = {}
-    transaction_details = AccountTransaction.objects.filter(id=transaction_id).first()
-    bank_account_details = BankAccount.objects.filter(id=transaction_details.bank_account_id).first()
-    customer_details = Customer.objects.filter(id=bank_account_details.customer_id).first()
-
-    payload = {
-        "transaction_date": transaction_details.transaction_date.strftime("%Y-%m-%d"),
-        "bank_account_number": str(transaction_details.bank_account),
-        "bank_account_type": str(bank_account_details.account_type),
-        "transaction_category": transaction_details.transaction_category.category_name,
-        "transaction_type": transaction_details.transaction_type.transaction_type,
-        "opening_balance": transaction_details.opening_balance,
-        "transaction_value": transaction_details.transaction_value,
-        "closing_balance": transaction_details.closing_balance,
-        "description": transaction_details.description,
-        "customer_name": f'{customer_details.first_name} {customer_details.last_name}',
-        "customer_email": customer_details.email
-    }
-    pattern = r"merchant: (.+?), location: (.+)$"
-    match = re.search(pattern, transaction_details.description)
-    if match:
-        merchant = match.group(1)
-        retailer_format = Retailer.objects.filter(name=merchant).first()
-        payload[
-            'description'] = f"{transaction_details.description} - retail category: {retailer_format.dominant_operational_format}"
-        payload['merchant_name'] = match.group(1)
-        payload['location'] = match.group(2)
-        payload['retail_category'] = retailer_format.dominant_operational_format
-
-        gmaps = googlemaps.Client(key=GOOGLE_MAPS_API_KEY)
-        geocode_result = gmaps.geocode(payload['location'])
-        location = geocode_result[0]['geometry']['location']
-        latitude = location['lat']
-        longitude = location['lng']
-        payload['geometry'] = {
-            "lat": latitude,
-            "lon": longitude
+
+
+def product_actions(products):
+    for product_detail in products:
+        yield {
+            '_index': product_index_name,
+            '_id': product_detail.id,
+            '_source': product_payload(product_detail),
+            'pipeline': product_pipeline_name
         }
-    payload = json.dumps(payload)
-    print(payload)
-    return payload
-
-
-# class Command(BaseCommand):
-#     help = 'Export un-exported records to Elasticsearch'
-#
-#     def handle(self, *args, **kwargs):
-#         records_to_import = AccountTransaction.objects.filter(exported=0)
-#         for r in records_to_import:
-#             payload = build_record(r.id)
-#             index_response = es.index(index=index_name, id=r.id, document=payload, pipeline=pipeline_name)
-#             r.exported = 1
-#             r.save()
-#
-#         banking_products_to_import = BankingProducts.objects.filter(exported=0)
-#         for r in banking_products_to_import:
-#             payload = build_product(r.id)
-#             index_response = es.index(index=product_index_name, id=r.id, document=payload, pipeline=pipeline_name)
-#             r.exported = 1
-#             r.save()
+
+
+def unexported_transaction_ids(chunk_size, last_id=0):
+    return keyset_ids(AccountTransaction.objects.filter(exported=False), chunk_size, last_id)
+
+
+def chunked(transaction_ids, chunk_size):
+    for i in range(0, len(transaction_ids), chunk_size):
+        yield transaction_ids[i:i + chunk_size]
+
+
+def transaction_actions(id_chunks):
+    for transaction_ids in id_chunks:
+        for transaction_id, payload in build_records(transaction_ids):
+            yield {
+                '_index': index_name,
+                '_id': str(transaction_id),
+                '_source': payload,
+                'pipeline': pipeline_name
+            }
+
+
+def open_ndjson(path, mode):
+    # .zst files are compressed and decompressed as a stream, so neither side holds more than a chunk
+    if str(path).endswith('.zst'):
+        if mode == 'w':
+            return zstandard.ZstdCompressor().stream_writer(open(path, 'wb'))
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb')))
+    return open(path, mode + 'b')
+
+
+def file_actions(ndjson_file):
+    # pairs of parsed action line and raw source line, the source is sent to _bulk as it was written
+    for action_line in ndjson_file:
+        if action_line.strip():
+            yield json.loads(action_line), next(ndjson_file).rstrip(b'\n')
+
+
+def tracked_actions(actions, in_flight):
+    # remembers each (action, source) pair by _id until its bulk result has been seen
+    for action, source in actions:
+        document_id = next(iter(action.values())).get('_id')
+        if document_id is not None:
+            in_flight[str(document_id)] = (action, source)
+        yield action, source
+
+
+def shipped_index_settings(names):
+    # the settings index_setup creates the index with, names it does not set go back to their default
+    with open(INDEX_SETTINGS_FILE) as settings_file:
+        shipped_settings = json.load(settings_file)
+    return {name: shipped_settings.get(name.removeprefix('index.')) for name in names}
+
+
+@contextmanager
+def bulk_load_settings(index, checkpoint=None, keep_replicas=False):
+    bulk_settings = {'index.refresh_interval': '-1'}
+    if not keep_replicas:
+        bulk_settings['index.number_of_replicas'] = 0
+    # the original values are stored on the checkpoint before anything is changed, so a run that is
+    # killed before restoring them hands them on to the run resuming it
+    saved_settings = dict(checkpoint.index_settings or {}) if checkpoint else {}
+    missing = [name for name in bulk_settings if name not in saved_settings]
+    if missing:
+        # explicit values are put back as they were, settings left at their default are reset with None
+        response = elasticsearch_client().indices.get_settings(index=index, name=missing, flat_settings=True)
+        current_settings = next(iter(response.values()), {}).get('settings', {})
+        if current_settings.get('index.refresh_interval') == '-1':
+            # left behind by an interrupted bulk load, not the values to restore
+            current_settings = shipped_index_settings(missing)
+        saved_settings.update({name: current_settings.get(name) for name in missing})
+        if checkpoint:
+            checkpoint.index_settings = saved_settings
+            checkpoint.save()
+    elasticsearch_client().indices.put_settings(index=index, settings=bulk_settings)
+    try:
+        yield saved_settings
+    finally:
+        elasticsearch_client().indices.put_settings(index=index, settings=saved_settings)
+        if checkpoint:
+            checkpoint.index_settings = None
+            checkpoint.save()
+
 
 class Command(BaseCommand):
     help = 'Export un-exported records to Elasticsearch'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Number of transactions per database page and bulk request')
+        parser.add_argument('--max-chunk-bytes', type=int, default=10 * 1024 * 1024,
+                            help='Maximum size in bytes of a single bulk request')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Number of bulk requests kept in flight, values above 1 use parallel_bulk')
+        parser.add_argument('--max-retries', type=int, default=5,
+                            help='Retries for throttled documents and for lost connections to Elasticsearch')
+        parser.add_argument('--initial-backoff', type=float, default=2,
+                            help='Seconds to wait before the first retry, doubled on every further retry')
+        parser.add_argument('--max-backoff', type=float, default=300,
+                            help='Upper bound in seconds for the wait between retries')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore the checkpoint of an interrupted export and start from the first record')
+        parser.add_argument('--bulk-load', action='store_true',
+                            help='Disable refreshes and replicas on the transaction index for the duration of the '
+                                 'export and restore its settings afterwards')
+        parser.add_argument('--keep-replicas', action='store_true',
+                            help='With --bulk-load, only disable refreshes and leave the replica count alone')
+        parser.add_argument('--to-file',
+                            help='Write every transaction as bulk NDJSON to this file instead of Elasticsearch, '
+                                 'compressed with zstandard when the name ends in .zst')
+        parser.add_argument('--from-file',
+                            help='Send a file written with --to-file to Elasticsearch without touching the database')
+
     def handle(self, *args, **kwargs):
-        banking_products_to_import = BankingProducts.objects.filter(exported=0)
-        for r in banking_products_to_import:
-            payload = build_product(r.id)
-            index_response = es.index(index=product_index_name, id=r.id, document=payload, pipeline=pipeline_name)
-            r.exported = 1
-            r.save()
+        self.chunk_size = kwargs['chunk_size']
+        self.max_chunk_bytes = kwargs['max_chunk_bytes']
+        self.workers = kwargs['workers']
+        max_retries = kwargs['max_retries']
+        initial_backoff = kwargs['initial_backoff']
+        max_backoff = kwargs['max_backoff']
 
-        while True:
-            # Fetch un-exported AccountTransaction records in batches of 100
-            account_transactions_to_import = AccountTransaction.objects.filter(exported=0)[:100]
-
-            # If there are no more records left, exit the loop
-            if not account_transactions_to_import:
-                break
-
-            # Prepare bulk payload for AccountTransaction records
-            account_transaction_payloads = [
-                {
-                    '_index': index_name,
-                    '_id': str(r.id),
-                    '_source': build_record(r.id),
-                    '_pipeline': pipeline_name
-                }
-                for r in account_transactions_to_import
-            ]
-
-            # Perform bulk indexing
-            success, _ = bulk(es, account_transaction_payloads)
-
-            # Update the exported flag for successfully indexed records
-            if success:
-                for r in account_transactions_to_import:
-                    r.exported = 1
-                    r.save()
-                self.stdout.write(self.style.SUCCESS('Indexing completed successfully.'))
+        if kwargs['bulk_load']:
+            self.load_settings = lambda checkpoint=None: bulk_load_settings(index_name, checkpoint,
+                                                                            kwargs['keep_replicas'])
+        else:
+            self.load_settings = lambda checkpoint=None: nullcontext()
+
+        if kwargs['to_file']:
+            self.write_file(kwargs['to_file'])
+            return
+        if kwargs['from_file']:
+            try:
+                with self.load_settings():
+                    self.replay_file(kwargs['from_file'], max_retries, initial_backoff, max_backoff)
+            finally:
+                elasticsearch_client().indices.refresh(index=index_name)
+            return
+
+        self.export_products()
+
+        checkpoint, _ = ExportCheckpoint.objects.get_or_create(name=index_name)
+        if kwargs['restart'] or checkpoint.completed:
+            checkpoint.high_water_mark = 0
+            checkpoint.completed = False
+            checkpoint.save()
+            checkpoint.failures.all().delete()
+        elif checkpoint.high_water_mark:
+            self.stdout.write(f'Resuming export after transaction {checkpoint.high_water_mark} with '
+                              f'{checkpoint.failures.count()} failed transactions on record.')
+
+        self.exported_count = 0
+        try:
+            with self.load_settings(checkpoint):
+                self.export_transactions(checkpoint, max_retries, initial_backoff, max_backoff)
+        finally:
+            # a single refresh once the load is over (or has failed) and the index settings are back
+            elasticsearch_client().indices.refresh(index=index_name)
+
+        checkpoint.completed = True
+        checkpoint.save()
+        self.stdout.write(self.style.SUCCESS(f'Indexing completed: {self.exported_count} transactions exported, '
+                                             f'{checkpoint.failures.count()} failed.'))
+
+    def export_products(self):
+        # the product catalogue is small, so it goes out in a single bulk request with one flag update
+        products = list(BankingProducts.objects.filter(exported=False).select_related('account_type'))
+        if not products:
+            return
+        exported_ids = []
+        for ok, item in streaming_bulk(elasticsearch_client(), product_actions(products), chunk_size=len(products),
+                                       max_chunk_bytes=self.max_chunk_bytes, raise_on_error=False):
+            result = list(item.values())[0]
+            if ok:
+                exported_ids.append(result['_id'])
             else:
-                self.stdout.write(self.style.ERROR('Indexing failed.'))
+                self.stdout.write(self.style.ERROR(f"Indexing failed for product {result.get('_id')}: "
+                                                   f"{result.get('error')}"))
+        BankingProducts.objects.filter(id__in=exported_ids).update(exported=True)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {len(exported_ids)} banking products.'))
+
+    def write_file(self, path):
+        # the file is independent of any cluster, so every transaction is written and no flags are touched
+        written_count = 0
+        with open_ndjson(path, 'w') as ndjson_file:
+            for action in transaction_actions(keyset_ids(AccountTransaction.objects.all(), self.chunk_size)):
+                header, source = expand_action(action)
+                ndjson_file.write(f'{json.dumps(header)}\n{json.dumps(source)}\n'.encode('utf-8'))
+                written_count = written_count + 1
+                if written_count % self.chunk_size == 0:
+                    self.stdout.write(f'Written {written_count} transactions.')
+        self.stdout.write(self.style.SUCCESS(f'Written {written_count} transactions to {path}.'))
+
+    def replay_file(self, path, max_retries, initial_backoff, max_backoff):
+        self.indexed_count = 0
+        self.failed_count = 0
+        with open_ndjson(path, 'r') as ndjson_file:
+            actions = file_actions(ndjson_file)
+            if self.workers > 1:
+                # parallel_bulk never retries, so the lines in flight are kept by _id and throttled ones
+                # are sent again through streaming_bulk and its backoff, one chunk at a time
+                in_flight = {}
+                retry_actions = []
+                results = parallel_bulk(elasticsearch_client(), tracked_actions(actions, in_flight), thread_count=self.workers,
+                                        queue_size=self.workers, chunk_size=self.chunk_size,
+                                        max_chunk_bytes=self.max_chunk_bytes,
+                                        expand_action_callback=lambda action: action, raise_on_error=False)
+                for ok, item in results:
+                    result = list(item.values())[0]
+                    pending_action = in_flight.pop(result.get('_id'), None)
+                    if not ok and pending_action and result.get('status') in TRANSIENT_STATUSES:
+                        retry_actions.append(pending_action)
+                        if len(retry_actions) >= self.chunk_size:
+                            self.retry_replay(retry_actions, max_retries, initial_backoff, max_backoff)
+                            retry_actions = []
+                    else:
+                        self.count_replayed(ok, result)
+                self.retry_replay(retry_actions, max_retries, initial_backoff, max_backoff)
+            else:
+                results = streaming_bulk(elasticsearch_client(), actions, chunk_size=self.chunk_size,
+                                         max_chunk_bytes=self.max_chunk_bytes,
+                                         expand_action_callback=lambda action: action, raise_on_error=False,
+                                         max_retries=max_retries, initial_backoff=initial_backoff,
+                                         max_backoff=max_backoff)
+                for ok, item in results:
+                    self.count_replayed(ok, list(item.values())[0])
+        self.stdout.write(self.style.SUCCESS(f'Replay completed: {self.indexed_count} documents indexed, '
+                                             f'{self.failed_count} failed.'))
+
+    def retry_replay(self, retry_actions, max_retries, initial_backoff, max_backoff):
+        if not retry_actions:
+            return
+        self.stdout.write(f'Retrying {len(retry_actions)} throttled documents.')
+        time.sleep(initial_backoff)
+        for ok, item in streaming_bulk(elasticsearch_client(), retry_actions, chunk_size=self.chunk_size,
+                                       max_chunk_bytes=self.max_chunk_bytes,
+                                       expand_action_callback=lambda action: action, raise_on_error=False,
+                                       max_retries=max_retries, initial_backoff=initial_backoff,
+                                       max_backoff=max_backoff):
+            self.count_replayed(ok, list(item.values())[0])
 
-            es.indices.refresh(index=index_name)
+    def count_replayed(self, ok, result):
+        if ok:
+            self.indexed_count = self.indexed_count + 1
+            if self.indexed_count % self.chunk_size == 0:
+                self.stdout.write(self.style.SUCCESS(f'Indexed {self.indexed_count} documents.'))
+        else:
+            self.failed_count = self.failed_count + 1
+            self.stdout.write(self.style.ERROR(f"Indexing failed for document {result.get('_id')}: "
+                                               f"{result.get('error')}"))
 
+    def export_transactions(self, checkpoint, max_retries, initial_backoff, max_backoff):
+        attempt = 0
+        while True:
+            try:
+                self.export_pass(checkpoint, unexported_transaction_ids(self.chunk_size,
+                                                                        checkpoint.high_water_mark))
+                # throttled or unavailable documents get further passes, other failures stay on record
+                for retry in range(1, max_retries + 1):
+                    retry_ids = checkpoint.transient_failures(TRANSIENT_STATUSES)
+                    if not retry_ids:
+                        break
+                    delay = backoff(retry, initial_backoff, max_backoff)
+                    self.stdout.write(f'Retrying {len(retry_ids)} transactions in {delay} seconds.')
+                    time.sleep(delay)
+                    self.export_pass(checkpoint, chunked(retry_ids, self.chunk_size))
+                return
+            except (ConnectionError, ConnectionTimeout, ApiError) as e:
+                if isinstance(e, ApiError) and e.status_code not in TRANSIENT_STATUSES:
+                    raise
+                attempt = attempt + 1
+                if attempt > max_retries:
+                    raise CommandError(f'Export stopped after {max_retries} retries, rerun the command to resume '
+                                       f'after transaction {checkpoint.high_water_mark}: {e}')
+                delay = backoff(attempt, initial_backoff, max_backoff)
+                self.stdout.write(self.style.WARNING(f'Elasticsearch request failed ({e}), resuming after '
+                                                     f'transaction {checkpoint.high_water_mark} in {delay} seconds.'))
+                time.sleep(delay)
+
+    def export_pass(self, checkpoint, id_chunks):
+        actions = transaction_actions(id_chunks)
+        if self.workers > 1:
+            # documents are built on the pool's feeder thread while the workers wait on the ingest
+            # pipeline, the queue holds at most one pending chunk per worker so memory stays flat
+            results = parallel_bulk(elasticsearch_client(), actions, thread_count=self.workers, queue_size=self.workers,
+                                    chunk_size=self.chunk_size, max_chunk_bytes=self.max_chunk_bytes,
+                                    raise_on_error=False)
+        else:
+            results = streaming_bulk(elasticsearch_client(), actions, chunk_size=self.chunk_size, max_chunk_bytes=self.max_chunk_bytes,
+                                     raise_on_error=False)
+
+        # results come back in submission order for both helpers, so the last id seen is a safe
+        # high water mark once everything up to it has been settled
+        exported_ids = []
+        failures = {}
+        last_id = 0
+        for ok, item in results:
+            result = item['index']
+            last_id = int(result['_id'])
+            if ok:
+                exported_ids.append(last_id)
+            else:
+                failures[last_id] = ExportFailure(checkpoint=checkpoint, transaction_id=last_id,
+                                                  status=result.get('status'), error=str(result.get('error'))[:512])
+                self.stdout.write(self.style.ERROR(f"Indexing failed for transaction {result['_id']}: "
+                                                   f"{result.get('error')}"))
+            if len(exported_ids) + len(failures) >= self.chunk_size:
+                self.save_progress(checkpoint, exported_ids, failures, last_id)
+                exported_ids = []
+                failures = {}
+        if exported_ids or failures:
+            self.save_progress(checkpoint, exported_ids, failures, last_id)
 
+    def save_progress(self, checkpoint, exported_ids, failures, last_id):
+        # only the ids Elasticsearch confirmed are flagged, in the same database transaction that moves
+        # the checkpoint forward
+        with transaction.atomic():
+            flag_exported(exported_ids)
+            # the documents are in the index now, the indexer does not need to send them again
+            TransactionOutbox.objects.filter(transaction_id__in=exported_ids).delete()
+            # failures are rows of their own, so a chunk only writes its own ids however many are on record
+            checkpoint.failures.filter(transaction_id__in=exported_ids).delete()
+            ExportFailure.objects.bulk_create(failures.values(), update_conflicts=True,
+                                              unique_fields=['checkpoint', 'transaction_id'],
+                                              update_fields=['status', 'error'])
+            checkpoint.high_water_mark = max(checkpoint.high_water_mark, last_id)
+            checkpoint.save()
+        self.exported_count = self.exported_count + len(exported_ids)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {self.exported_count} transactions.'))
@@ -1,192 +1,76 @@
-import uuid
-import csv
+import multiprocessing
+import time
 from onlinebanking.models import Customer, CustomerAddress, BankAccountType, BankAccount, \
-    TransactionCategory, AccountTransaction, AccountTransactionType, Retailer
+    TransactionCategory
 from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models.functions import Mod
+from elasticsearch.helpers import streaming_bulk
+from envmanager.indexing import build_payload, elasticsearch_client, index_name, keyset_ids, pipeline_name
+from envmanager.generation import Ledger, address_pool, build_account_index, import_retailers, \
+    load_rows, new_uuid, peak_memory_mb, reference_time, seed_random_sources, plan_transactions, plan_accounts, affordable_purchases, PAYDAY, TRANSFER, \
+    PURCHASE
 import random
 from mimesis import Person, Finance
 from mimesis.locales import Locale
-from time import sleep
-from datetime import datetime, timedelta
 import string
-from config.settings import BASE_DIR
-import random_address
-from datetime import datetime, timedelta, timezone
+from datetime import date, timedelta
 
 person = Person(locale=Locale.EN)
 finance = Finance(locale=Locale.EN_GB)
 
 
 def generate_address():
-    address = random_address.real_random_address()
-    key = 'city'
-    if key not in address:
-        address[key] = 'San Francisco'
-    return address
+    return address_pool().address()
 
 
-def generate_inbound_payment(bank_account, transaction_date, transaction_value):
+def generate_inbound_payment(ledger, bank_account, transaction_date, transaction_value):
     description = f"Inbound payment made from {bank_account}, " \
-                  f"{finance.company()}: {uuid.uuid4()}"
-    transaction_type = AccountTransactionType.objects.filter(transaction_type='Credit').first()
-    transaction_category = TransactionCategory.objects.filter(category_name='EFT').first()
-    latest_transaction = AccountTransaction.objects.filter(
-        bank_account=bank_account).order_by('-timestamp').first()
-    if latest_transaction:
-        closing_balance = latest_transaction.closing_balance
-    else:
-        closing_balance = 0
-    transaction_value = transaction_value
-    if transaction_type.transaction_operator == '-':
-        new_closing_balance = closing_balance - transaction_value
-    elif transaction_type.transaction_operator == '+':
-        new_closing_balance = closing_balance + transaction_value
-
-    AccountTransaction.objects.create(
-        bank_account=bank_account,
-        transaction_type=transaction_type,
-        transaction_category=transaction_category,
-        opening_balance=closing_balance,
-        transaction_value=transaction_value,
-        closing_balance=new_closing_balance,
-        description=description,
-        transaction_date=transaction_date
-    )
-    return
-
-
-def generate_outbound_payment(bank_account, transaction_date, transaction_value):
+                  f"{finance.company()}: {new_uuid()}"
+    ledger.post(bank_account, 'Credit', 'EFT', transaction_value, description, transaction_date)
+
+
+def generate_outbound_payment(ledger, bank_account, transaction_date, transaction_value):
     description = f"Payment made from {bank_account} to {person.first_name()} {person.last_name()}, " \
-                  f"{finance.company()}: {uuid.uuid4()}"
-    transaction_type = AccountTransactionType.objects.filter(transaction_type='Debit').first()
-    transaction_category = TransactionCategory.objects.filter(category_name='EFT').first()
-    latest_transaction = AccountTransaction.objects.filter(
-        bank_account=bank_account).order_by('-timestamp').first()
-    if latest_transaction:
-        closing_balance = latest_transaction.closing_balance
-    else:
-        closing_balance = 0
-    transaction_value = transaction_value
-    if transaction_type.transaction_operator == '-':
-        new_closing_balance = closing_balance - transaction_value
-    elif transaction_type.transaction_operator == '+':
-        new_closing_balance = closing_balance + transaction_value
-
-    AccountTransaction.objects.create(
-        bank_account=bank_account,
-        transaction_type=transaction_type,
-        transaction_category=transaction_category,
-        opening_balance=closing_balance,
-        transaction_value=transaction_value,
-        closing_balance=new_closing_balance,
-        description=description,
-        transaction_date=transaction_date
-    )
-    return
-
-
-def generate_transfer(bank_account, transaction_date, transaction_value):
-    other_bank_account = BankAccount.objects.exclude(pk=bank_account.pk).first()
-    if other_bank_account:
-        outbound_transaction_type = AccountTransactionType.objects.filter(transaction_type='Debit').first()
-        inbound_transaction_type = AccountTransactionType.objects.filter(transaction_type='Credit').first()
-        transaction_category = TransactionCategory.objects.filter(category_name='Transfer').first()
-        outbound_latest_transaction = AccountTransaction.objects.filter(
-            bank_account=bank_account).order_by('-timestamp').first()
-        if outbound_latest_transaction:
-            last_outbound_closing_balance = outbound_latest_transaction.closing_balance
-        else:
-            last_outbound_closing_balance = 0
-        transaction_value = transaction_value
-        outbound_closing_balance = last_outbound_closing_balance - transaction_value
-        inbound_latest_transaction = AccountTransaction.objects.filter(
-            bank_account=other_bank_account).order_by('-timestamp').first()
-        if inbound_latest_transaction:
-            last_inbound_closing_balance = inbound_latest_transaction.closing_balance
-        else:
-            last_inbound_closing_balance = 0
-        inbound_closing_balance = last_inbound_closing_balance + transaction_value
-        description = f"Transfer made from {bank_account} to {other_bank_account} - Reason: internal"
-
-        # outbound transaction
-        AccountTransaction.objects.create(
-            bank_account=bank_account,
-            transaction_type=outbound_transaction_type,
-            transaction_category=transaction_category,
-            opening_balance=last_outbound_closing_balance,
-            transaction_value=transaction_value,
-            closing_balance=outbound_closing_balance,
-            description=description,
-            transaction_date=transaction_date
-        )
-
-        # inbound transaction
-        AccountTransaction.objects.create(
-            bank_account=other_bank_account,
-            transaction_type=inbound_transaction_type,
-            transaction_category=transaction_category,
-            opening_balance=last_inbound_closing_balance,
-            transaction_value=transaction_value,
-            closing_balance=inbound_closing_balance,
-            description=description,
-            transaction_date=transaction_date
-        )
-    return
-
-
-def generate_purchase(bank_account, transaction_date, transaction_value):
-    transaction_type = AccountTransactionType.objects.filter(transaction_type='Debit').first()
-    transaction_category = TransactionCategory.objects.filter(category_name='Purchase').first()
-    latest_transaction = AccountTransaction.objects.filter(
-        bank_account=bank_account).order_by('-timestamp').first()
-    if latest_transaction:
-        opening_balance = latest_transaction.closing_balance
-    else:
-        opening_balance = random.randint(100, 5000)
-    transaction_value = transaction_value
-    if transaction_type.transaction_operator == '-':
-        closing_balance = opening_balance - transaction_value
-    elif transaction_type.transaction_operator == '+':
-        closing_balance = opening_balance + transaction_value
-    retailers = Retailer.objects.all()
-    retailer = random.choice(retailers)
+                  f"{finance.company()}: {new_uuid()}"
+    ledger.post(bank_account, 'Debit', 'EFT', transaction_value, description, transaction_date)
+
+
+def generate_transfer(ledger, bank_account, other_bank_account, transaction_date, transaction_value):
+    description = f"Transfer made from {bank_account} to {other_bank_account} - Reason: internal"
+    # outbound transaction
+    ledger.post(bank_account, 'Debit', 'Transfer', transaction_value, description, transaction_date)
+    # inbound transaction
+    ledger.post(other_bank_account, 'Credit', 'Transfer', transaction_value, description, transaction_date)
+
+
+def generate_purchase(ledger, bank_account, transaction_date, transaction_value):
+    retailer = random.choice(ledger.retailers)
     address = generate_address()
     city = address['city']
     state = address['state']
-    description = f"Purchase at merchant: {retailer.name}, location: {city},{state}"
-
-    AccountTransaction.objects.create(
-        bank_account=bank_account,
-        transaction_type=transaction_type,
-        transaction_category=transaction_category,
-        opening_balance=opening_balance,
-        transaction_value=transaction_value,
-        closing_balance=closing_balance,
-        description=description,
-        transaction_date=transaction_date
-    )
-
-
-def import_retailers():
-    from onlinebanking.models import Retailer
-    with open(BASE_DIR / "files/cos2019.csv", newline='') as csvfile:
-        reader = csv.DictReader(csvfile, delimiter=';')
-        for row in reader:
-            instance = Retailer(
-                name=row['name'],
-                dominant_operational_format=row['dominant_operational_format'],
-            )
-            instance.save()
-
-
-def generate_customer():
+    location = f"{city},{state}"
+    coordinates = address.get('coordinates', {})
+    description = f"Purchase at merchant: {retailer.name}, location: {location}"
+    # accounts without any transaction start from a random balance
+    opening_balance = None if ledger.state(bank_account).sequence else random.randint(100, 5000)
+    ledger.post(bank_account, 'Debit', 'Purchase', transaction_value, description, transaction_date,
+                opening_balance=opening_balance,
+                merchant_name=retailer.name,
+                location=location,
+                retailer=retailer,
+                latitude=coordinates.get('lat'),
+                longitude=coordinates.get('lng'))
+
+
+def generate_customer(as_of):
     letters = string.ascii_letters
     prefix_length = random.randint(3, 6)
     suffix_length = random.randint(3, 6)
     prefix = ''.join(random.choice(letters) for _ in range(prefix_length))
     suffix = ''.join(random.choice(letters) for _ in range(suffix_length))
 
-    current_date = datetime.now()
+    current_date = as_of.date()
     start_date = current_date - timedelta(days=365 * 100)
     end_date = current_date - timedelta(days=365 * 18)
     random_days = random.randint(0, (end_date - start_date).days)
@@ -196,16 +80,16 @@ def generate_customer():
     email = f"{prefix}{suffix}@demo-domain.org"
     date_of_birth = start_date + timedelta(days=random_days)
 
-    new_customer = Customer.objects.create(first_name=first_name, last_name=last_name, email=email,
-                                           date_of_birth=date_of_birth)
+    new_customer = Customer(first_name=first_name, last_name=last_name, email=email,
+                            date_of_birth=date_of_birth)
     return new_customer
 
 
 def generate_customer_address(customer):
     address = generate_address()
-    CustomerAddress.objects.create(customer=customer, address_line_one=address['address1'],
-                                   address_line_two=address['address2'],
-                                   suburb=address['city'], postal_code=address['postalCode'])
+    return CustomerAddress(customer=customer, address_line_one=address['address1'],
+                           address_line_two=address['address2'],
+                           suburb=address['city'], postal_code=address['postalCode'])
 
 
 def random_description():
@@ -221,24 +105,134 @@ def generate_bank_account_number():
     return acc_number
 
 
-def generate_bank_account(customer):
-    bank_accounts = BankAccount.objects.filter(customer=customer)
-    if not bank_accounts:
-        bank_account_type = BankAccountType.objects.filter(account_type='Transmission').first()
+def generate_bank_account(customer, bank_account_types, has_accounts):
+    # a customer's first account is always a Transmission account
+    if not has_accounts:
+        bank_account_type = next(t for t in bank_account_types if t.account_type == 'Transmission')
     else:
-        bank_account_type_list = BankAccountType.objects.all()
-        bank_account_type = random.choice(bank_account_type_list)
+        bank_account_type = random.choice(bank_account_types)
 
     account_number = generate_bank_account_number()
     account_number = f"{account_number}-{bank_account_type.account_type}"
-    BankAccount.objects.create(account_type=bank_account_type, account_number=account_number, customer=customer,
-                               exported=0)
-    return
+    return BankAccount(account_type=bank_account_type, account_number=account_number, customer=customer,
+                       exported=0)
+
+
+def generate_customer_transactions(ledger, rng, customer, account_index, start_date, end_date,
+                                   transaction_minimum, transaction_maximum, category_list, weight_list):
+    # set customer variables
+    is_wealthy = rng.random() < 0.01
+    is_debt = rng.random() < 0.01
+    number_of_days = (end_date - start_date).days + 1
+    day, kind, value = plan_transactions(rng, number_of_days, transaction_minimum, transaction_maximum,
+                                         category_list, weight_list, is_wealthy)
+
+    bank_accounts = account_index.all
+    transmission = [bank_accounts.index(b) for b in account_index.transmission]
+    transactional = [bank_accounts.index(b) for b in account_index.transactional]
+    account, target = plan_accounts(rng, kind, transmission, transactional, len(bank_accounts))
+    # transfers need a second account of the same customer
+    planned = (account >= 0) & ((kind != TRANSFER) | (target >= 0))
+    day, kind, value, account, target = day[planned], kind[planned], value[planned], account[planned], \
+        target[planned]
+    if not is_debt:
+        # purchases only go ahead if the customer actually has the money for them
+        ledger.track(bank_accounts)
+        affordable = affordable_purchases(kind, account, target, value,
+                                          [ledger.balance(b) for b in bank_accounts])
+        day, kind, value, account, target = day[affordable], kind[affordable], value[affordable], \
+            account[affordable], target[affordable]
+
+    dates = [start_date + timedelta(days=d) for d in range(number_of_days)]
+    for d, k, v, a, t in zip(day.tolist(), kind.tolist(), value.tolist(), account.tolist(), target.tolist()):
+        if k == PAYDAY:
+            generate_inbound_payment(ledger, bank_accounts[a], dates[d], v)
+        elif k == PURCHASE:
+            generate_purchase(ledger, bank_accounts[a], dates[d], v)
+        elif k == TRANSFER:
+            generate_transfer(ledger, bank_accounts[a], bank_accounts[t], dates[d], v)
+        else:
+            generate_outbound_payment(ledger, bank_accounts[a], dates[d], v)
+    print(f"Generated {day.size} transactions for {customer}")
+
+
+def create_accounts(customers, bank_account_types):
+    """Creates an address and two to four bank accounts for every customer of a chunk."""
+    customers_with_accounts = set(BankAccount.objects.filter(
+        customer_id__in=[c.id for c in customers]).values_list('customer_id', flat=True))
+    customer_addresses = []
+    bank_accounts = []
+    for customer in customers:
+        customer_addresses.append(generate_customer_address(customer))
+        number_bank_accounts = random.randint(1, 3)
+        bank_account_counter = 0
+        while bank_account_counter <= number_bank_accounts:
+            has_accounts = customer.id in customers_with_accounts or bank_account_counter > 0
+            bank_accounts.append(generate_bank_account(customer, bank_account_types, has_accounts))
+            bank_account_counter = bank_account_counter + 1
+    with transaction.atomic():
+        load_rows(CustomerAddress, customer_addresses)
+        load_rows(BankAccount, bank_accounts)
+
+
+def generate_shard(shard):
+    """
+    Generates the accounts and transactions of one shard of customers and returns a summary. Each shard
+    has its own ledger and seeded RNGs, transfers stay between a customer's own accounts so shards never
+    touch each other's balances. Customers are streamed in chunks and everything held for a chunk is
+    released once it is written, so memory does not grow with the number of customers.
+    """
+    shard_number, seed, options = shard
+    started = time.monotonic()
+    rng = seed_random_sources(seed, person, finance)
+    ledger = Ledger(batch_size=options['batch_size'],
+                    writer=index_documents if options['direct_to_es'] else None)
+    bank_account_types = list(BankAccountType.objects.order_by('id'))
+    customers = Customer.objects.annotate(shard=Mod('id', options['processes'])).filter(shard=shard_number)
+    customer_count = 0
+    # keyset pages rather than one long running cursor, which would block the other shards' writes on SQLite
+    for customer_ids in keyset_ids(customers, options['chunk_size']):
+        chunk = list(Customer.objects.filter(id__in=customer_ids).order_by('id'))
+        create_accounts(chunk, bank_account_types)
+        account_index = build_account_index([c.id for c in chunk])
+        for customer in chunk:
+            generate_customer_transactions(ledger, rng, customer, account_index[customer.id],
+                                           options['start_date'], options['end_date'],
+                                           options['transaction_minimum'], options['transaction_maximum'],
+                                           options['category_list'], options['weight_list'])
+        ledger.release()
+        customer_count = customer_count + len(chunk)
+        print(f"Shard {shard_number}: {customer_count} customers, {ledger.written_count} transactions, "
+              f"peak memory {peak_memory_mb():.0f} MB")
+    elapsed = time.monotonic() - started
+    return shard_number, customer_count, ledger.written_count, seed, elapsed, peak_memory_mb()
+
+
+def index_documents(transactions):
+    """
+    Ledger writer for --direct-to-es. The batch is indexed in the layout of build_payload without being
+    saved, the reference UUID doubles as document id since the rows never get a primary key.
+    """
+    actions = ({
+        '_index': index_name,
+        '_id': str(t.reference),
+        '_source': build_payload(t, {}, {}),
+        'pipeline': pipeline_name
+    } for t in transactions)
+    indexed_count = 0
+    # the client is only created when --direct-to-es is used, plain runs need no cluster configured
+    for ok, item in streaming_bulk(elasticsearch_client(), actions, chunk_size=500, raise_on_error=False,
+                                   max_retries=3):
+        if ok:
+            indexed_count = indexed_count + 1
+        else:
+            result = list(item.values())[0]
+            print(f"Indexing failed for document {result.get('_id')}: {result.get('error')}")
+    return indexed_count
 
 
-def get_date_x_months_ago(x):
-    current_date = datetime.now(tz=timezone.utc)
-    months_ago_date = current_date - timedelta(days=30 * x)
+def get_date_x_months_ago(x, as_of):
+    months_ago_date = as_of - timedelta(days=30 * x)
     return months_ago_date
 
 
@@ -251,6 +245,20 @@ class Command(BaseCommand):
                             help='Indicates the number of months to create transactions for')
         parser.add_argument('arg3', type=int, help='Indicates the minimum transaction value')
         parser.add_argument('arg4', type=int, help='Indicates the maximum transaction value')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Number of transactions written per bulk insert')
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Number of worker processes the customers are partitioned across')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of customers created and generated at a time')
+        parser.add_argument('--seed', type=int,
+                            help='Seed every random source so the same seed and arguments give the same dataset')
+        parser.add_argument('--as-of', type=date.fromisoformat,
+                            help='Date (YYYY-MM-DD) the generated dates are counted back from, defaults to a fixed '
+                                 'date when --seed is given and to today otherwise')
+        parser.add_argument('--direct-to-es', action='store_true',
+                            help='Index the generated transactions straight into Elasticsearch instead of '
+                                 'saving them, customers and accounts are still created in the database')
 
     def handle(self, *args, **kwargs):
         number_of_customers = kwargs['arg1']
@@ -258,90 +266,62 @@ class Command(BaseCommand):
         transaction_minimum = kwargs['arg3']
         transaction_maximum = kwargs['arg4']
 
+        chunk_size = kwargs['chunk_size']
+        base_seed = kwargs['seed'] if kwargs['seed'] is not None else random.SystemRandom().randrange(2 ** 32)
+        seed_random_sources(base_seed, person, finance)
+        as_of = reference_time(kwargs['as_of'], kwargs['seed'])
+        print(f"Generating with seed {base_seed} as of {as_of.date()}")
+
         import_retailers()
         customer_counter = 1
         while customer_counter <= number_of_customers:
-            customer = generate_customer()
-            print(f"Executed cycle {customer_counter} of {number_of_customers}")
-            customer_counter = customer_counter + 1
-
-        all_customers = Customer.objects.all()
-        transaction_categories = TransactionCategory.objects.all()
+            new_customers = []
+            while customer_counter <= number_of_customers and len(new_customers) < chunk_size:
+                new_customers.append(generate_customer(as_of))
+                print(f"Executed cycle {customer_counter} of {number_of_customers}")
+                customer_counter = customer_counter + 1
+            with transaction.atomic():
+                load_rows(Customer, new_customers)
+
+        transaction_categories = TransactionCategory.objects.order_by('id')
         category_list = []
         weight_list = []
         for t in transaction_categories:
             category_list.append(t.category_name)
             weight_list.append(int(t.weight))
-        for customer in all_customers:
-            generate_customer_address(customer)
-            number_bank_accounts = random.randint(1, 3)
-            bank_account_counter = 0
-            while bank_account_counter <= number_bank_accounts:
-                generate_bank_account(customer)
-                bank_account_counter = bank_account_counter + 1
-
-        start_date = get_date_x_months_ago(number_of_months)
-        end_date = datetime.now(tz=timezone.utc)
-        for customer in all_customers:
-            # set customer variables
-            is_wealthy = random.choices([1, 0], weights=[0.01, 0.99])
-            is_debt = random.choices([1, 0], weights= [0.01, 0.99])
-            current_date = start_date
-            loop_count = 0
-            while current_date <= end_date:
-                print(f"{current_date} --> {end_date}")
-                payday = 0
-                if loop_count % 30 == 0 or loop_count == 0:
-                    payday = 1
-                transaction_count = random.randint(transaction_minimum, transaction_maximum)
-                transaction_counter = 1
-                while transaction_counter <= transaction_count:
-                    # if it is a payday and the first transaction of the payday, make it an inbound payment
-                    if payday == 1 and transaction_counter == 1:
-                        print(f'Payday whooooo. Loop count: {loop_count} and transaction count: {transaction_counter} out of {transaction_count}')
-                        # transaction_category = TransactionCategory.objects.filter(category_name='EFT').first()
-                        if is_wealthy == 1:
-                            transaction_value = random.randint(10000, 50000)
-                        else:
-                            transaction_value = random.randint(1500, 8000)
-                        bank_account = BankAccount.objects.filter(customer=customer,
-                                                                  account_type__account_type='Transmission').order_by(
-                            '?').first()
-                        generate_inbound_payment(bank_account, current_date, transaction_value)
-                    else:
-                        transaction_category = random.choices(category_list, weights=weight_list)[0]
-                        # handle non-purchases
-                        if transaction_category != 'Purchase':
-                            # transaction_type = AccountTransactionType.objects.order_by('?').first()
-                            bank_account = BankAccount.objects.filter(customer=customer).order_by('?').first()
-                            is_transfer = random.choices([1,0],weights=[0.01,0.99])
-                            if is_transfer == 1:
-                                transaction_value = random.randint(200, 800)
-                                generate_transfer(bank_account, current_date, transaction_value)
-                            else:
-                                transaction_value = random.randint(50, 1000)
-                                generate_outbound_payment(bank_account, current_date, transaction_value)
-                        # now handle purchases
-                        else:
-                            bank_account = BankAccount.objects.filter(customer=customer,
-                                                                      account_type__transactional=True).order_by(
-                                '?').first()
-                            transaction_value = random.randint(10, 200)
-                            if is_debt == 1:
-                                # go ahead and spend even if the user has no money left
-                                generate_purchase(bank_account, current_date, transaction_value)
-                            else:
-                                # check whether the user actually has the money for this
-                                latest_transaction = AccountTransaction.objects.filter(
-                                    bank_account=bank_account).order_by('-timestamp').first()
-                                # if they have money, go ahead and make the purchase, otherwise do nothing
-                                if latest_transaction:
-                                    closing_balance = latest_transaction.closing_balance
-                                else:
-                                    closing_balance= 0
-                                if closing_balance - transaction_value > 0:
-                                    generate_purchase(bank_account, current_date, transaction_value)
-                    transaction_counter = transaction_counter + 1
-                    print(f"transaction: {transaction_counter} of {transaction_count}")
-                current_date += timedelta(days=1)
-                loop_count = loop_count + 1
+        options = {
+            'batch_size': kwargs['batch_size'],
+            'start_date': get_date_x_months_ago(number_of_months, as_of),
+            'end_date': as_of,
+            'transaction_minimum': transaction_minimum,
+            'transaction_maximum': transaction_maximum,
+            'category_list': category_list,
+            'weight_list': weight_list,
+            'direct_to_es': kwargs['direct_to_es'],
+            'processes': kwargs['processes'],
+            'chunk_size': chunk_size
+        }
+        processes = kwargs['processes']
+        shards = [(shard_number, base_seed + shard_number, options) for shard_number in range(processes)]
+        # loaded once here so forked workers share the address pool instead of each parsing the dataset
+        address_pool()
+        if processes > 1:
+            # workers are forked with Django already set up and open their own database connections,
+            # the copies of ours must not be shared between processes
+            connections.close_all()
+            with multiprocessing.get_context('fork').Pool(processes=processes) as pool:
+                results = list(pool.imap_unordered(generate_shard, shards))
+        else:
+            results = [generate_shard(shard) for shard in shards]
+
+        total_customers = 0
+        total_transactions = 0
+        for shard_number, customer_count, transaction_count, seed, elapsed, peak_memory in sorted(results):
+            print(f"Shard {shard_number}: {customer_count} customers, {transaction_count} transactions "
+                  f"in {elapsed:.1f}s (seed {seed}, peak memory {peak_memory:.0f} MB)")
+            total_customers = total_customers + customer_count
+            total_transactions = total_transactions + transaction_count
+        print(f"Generated {total_transactions} transactions for {total_customers} customers "
+              f"across {len(results)} shards, peak memory {peak_memory_mb():.0f} MB")
+        if kwargs['direct_to_es']:
+            elasticsearch_client().indices.refresh(index=index_name)
@@ -1,11 +1,11 @@
-import random_address
-import uuid
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
 from mimesis import Person, Finance
 from mimesis.locales import Locale
 from django.core.management.base import BaseCommand
+from onlinebanking.posting import post_transaction
+from envmanager.generation import address_pool, new_uuid, reference_time, seed_random_sources, retailers
 from onlinebanking.models import BankingProducts, BankAccountType, BankAccount, \
-    TransactionCategory, AccountTransaction, AccountTransactionType, Retailer, Customer
+    TransactionCategory, AccountTransaction, AccountTransactionType, Customer
 import random
 from config import settings
 
@@ -16,11 +16,7 @@ finance = Finance(locale=Locale.EN_GB)
 
 
 def generate_address():
-    address = random_address.real_random_address()
-    key = 'city'
-    if key not in address:
-        address[key] = 'San Francisco'
-    return address
+    return address_pool().address()
 
 
 def get_date_x_months_ago(x):
@@ -32,62 +28,38 @@ def get_date_x_months_ago(x):
 def generate_inbound_payment(bank_account, transaction_date, transaction_value, keywords):
     random_keyword = random.choice(keywords)
     description = f"Inbound payment made from {bank_account} for {random_keyword}, " \
-                  f"{finance.company()}: {uuid.uuid4()}"
+                  f"{finance.company()}: {new_uuid()}"
     transaction_type = AccountTransactionType.objects.filter(transaction_type='Credit').first()
     transaction_category = TransactionCategory.objects.filter(category_name='EFT').first()
-    latest_transaction = AccountTransaction.objects.filter(
-        bank_account=bank_account).order_by('-timestamp').first()
-    if latest_transaction:
-        closing_balance = latest_transaction.closing_balance
-    else:
-        closing_balance = 0
-    transaction_value = transaction_value
-    if transaction_type.transaction_operator == '-':
-        new_closing_balance = closing_balance - transaction_value
-    elif transaction_type.transaction_operator == '+':
-        new_closing_balance = closing_balance + transaction_value
-
-    new_transaction = AccountTransaction.objects.create(
+
+    new_transaction = post_transaction(AccountTransaction(
+        reference=new_uuid(),
         bank_account=bank_account,
         transaction_type=transaction_type,
         transaction_category=transaction_category,
-        opening_balance=closing_balance,
         transaction_value=transaction_value,
-        closing_balance=new_closing_balance,
         description=description,
         transaction_date=transaction_date
-    )
+    ))
     return new_transaction
 
 
 def generate_outbound_payment(bank_account, transaction_date, transaction_value, keywords):
     keyword = random.choice(keywords)
     description = f"Payment made from {bank_account} to {person.first_name()} {person.last_name()} for { keyword }, " \
-                  f"{finance.company()}: {uuid.uuid4()}"
+                  f"{finance.company()}: {new_uuid()}"
     transaction_type = AccountTransactionType.objects.filter(transaction_type='Debit').first()
     transaction_category = TransactionCategory.objects.filter(category_name='EFT').first()
-    latest_transaction = AccountTransaction.objects.filter(
-        bank_account=bank_account).order_by('-timestamp').first()
-    if latest_transaction:
-        closing_balance = latest_transaction.closing_balance
-    else:
-        closing_balance = 0
-    transaction_value = transaction_value
-    if transaction_type.transaction_operator == '-':
-        new_closing_balance = closing_balance - transaction_value
-    elif transaction_type.transaction_operator == '+':
-        new_closing_balance = closing_balance + transaction_value
-
-    AccountTransaction.objects.create(
+
+    post_transaction(AccountTransaction(
+        reference=new_uuid(),
         bank_account=bank_account,
         transaction_type=transaction_type,
         transaction_category=transaction_category,
-        opening_balance=closing_balance,
         transaction_value=transaction_value,
-        closing_balance=new_closing_balance,
         description=description,
         transaction_date=transaction_date
-    )
+    ))
     return
 
 
@@ -95,34 +67,29 @@ def generate_purchase(bank_account, transaction_date, transaction_value, keyword
     keyword = random.choice(keywords)
     transaction_type = AccountTransactionType.objects.filter(transaction_type='Debit').first()
     transaction_category = TransactionCategory.objects.filter(category_name='Purchase').first()
-    latest_transaction = AccountTransaction.objects.filter(
-        bank_account=bank_account).order_by('-timestamp').first()
-    if latest_transaction:
-        opening_balance = latest_transaction.closing_balance
-    else:
-        opening_balance = random.randint(100, 5000)
-    transaction_value = transaction_value
-    if transaction_type.transaction_operator == '-':
-        closing_balance = opening_balance - transaction_value
-    elif transaction_type.transaction_operator == '+':
-        closing_balance = opening_balance + transaction_value
-    retailers = Retailer.objects.all()
-    retailer = random.choice(retailers)
+    retailer = random.choice(retailers())
     address = generate_address()
     city = address['city']
     state = address['state']
-    description = f"Purchase at merchant: {retailer.name}-{keyword}, location: {city},{state}"
+    merchant_name = f"{retailer.name}-{keyword}"
+    location = f"{city},{state}"
+    coordinates = address.get('coordinates', {})
+    description = f"Purchase at merchant: {merchant_name}, location: {location}"
 
-    AccountTransaction.objects.create(
+    post_transaction(AccountTransaction(
+        reference=new_uuid(),
         bank_account=bank_account,
         transaction_type=transaction_type,
         transaction_category=transaction_category,
-        opening_balance=opening_balance,
         transaction_value=transaction_value,
-        closing_balance=closing_balance,
         description=description,
-        transaction_date=transaction_date
-    )
+        transaction_date=transaction_date,
+        merchant_name=merchant_name,
+        location=location,
+        retailer=retailer,
+        latitude=coordinates.get('lat'),
+        longitude=coordinates.get('lng')
+    ), initial_balance=random.randint(100, 5000))
     return
 
 def generate_bank_account_number():
@@ -143,11 +110,20 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('arg1', type=int, help='Indicates the id of the product offer used.')
+        parser.add_argument('--seed', type=int,
+                            help='Seed every random source so the same seed and arguments give the same dataset')
+        parser.add_argument('--as-of', type=date.fromisoformat,
+                            help='Date (YYYY-MM-DD) the generated dates are counted back from, defaults to a fixed '
+                                 'date when --seed is given and to today otherwise')
 
     def handle(self, *args, **kwargs):
         banking_product_id = kwargs['arg1']
+        seed_random_sources(kwargs['seed'], person, finance)
+        as_of = reference_time(kwargs['as_of'], kwargs['seed'])
         banking_product = BankingProducts.objects.get(id=banking_product_id)
         print(banking_product.generator_keywords)
+        # retailers may have been cleared since this process last loaded them
+        retailers(reload=True)
         customer = Customer.objects.get(id=customer_id)
         bank_account = BankAccount.objects.filter(customer_id=customer_id,
                                                   account_type=banking_product.account_type).first()
@@ -166,7 +142,7 @@ class Command(BaseCommand):
 
         while counter <= number_of_transactions:
             random_day = random.randint(0, number_of_transactions)
-            random_transaction_date = datetime.now().date() - timedelta(days=random_day)
+            random_transaction_date = as_of.date() - timedelta(days=random_day)
             if str(banking_product.account_type) == 'Savings':
                 min_transaction_value = 100
                 max_transaction_value = 500
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from onlinebanking.models import AccountTransaction, BankAccount
+from onlinebanking.posting import rebuilt_balances
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the current balance and posting sequence of every bank account from its transactions'
+
+    def handle(self, *args, **kwargs):
+        with transaction.atomic():
+            updated_count = BankAccount.objects.update(**rebuilt_balances(AccountTransaction))
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the balances of {updated_count} bank accounts.'))
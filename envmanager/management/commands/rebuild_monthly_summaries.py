@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from envmanager.indexing import keyset_ids
+from onlinebanking.models import AccountMonthlySummary, AccountTransaction, BankAccount
+from onlinebanking.summaries import update_summaries
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the monthly summaries of every bank account from its transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=100,
+                            help='Number of bank accounts rebuilt per database transaction')
+
+    def handle(self, *args, **kwargs):
+        account_count = 0
+        for bank_account_ids in keyset_ids(BankAccount.objects.all(), kwargs['chunk_size']):
+            # each chunk of accounts is replaced in its own transaction, an interrupted rebuild can be rerun
+            with transaction.atomic():
+                AccountMonthlySummary.objects.filter(bank_account_id__in=bank_account_ids).delete()
+                update_summaries(AccountTransaction.objects.filter(bank_account_id__in=bank_account_ids).select_related(
+                    'transaction_type', 'transaction_category').order_by('id'))
+            account_count = account_count + len(bank_account_ids)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the monthly summaries of {account_count} bank accounts.'))
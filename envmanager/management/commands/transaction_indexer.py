@@ -0,0 +1,115 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from elasticsearch.helpers import streaming_bulk
+from onlinebanking.models import TransactionOutbox
+from envmanager.indexing import backoff, build_records, elasticsearch_client, flag_exported, index_name, \
+    pipeline_name
+
+
+def retry_delay(attempts, max_delay=600):
+    return timedelta(seconds=min(2 ** attempts, max_delay))
+
+
+class Command(BaseCommand):
+    help = 'Index posted transactions from the outbox into Elasticsearch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of outbox entries indexed per bulk request')
+        parser.add_argument('--poll-interval', type=float, default=2,
+                            help='Seconds to wait before polling an empty outbox again')
+        parser.add_argument('--max-attempts', type=int, default=10,
+                            help='Entries that failed this many times are left in the outbox for inspection')
+        parser.add_argument('--max-backoff', type=float, default=300,
+                            help='Upper bound in seconds for the wait after a batch could not be indexed')
+        parser.add_argument('--claim-timeout', type=float, default=600,
+                            help='Seconds before entries claimed by a worker that died are picked up again')
+        parser.add_argument('--once', action='store_true', help='Drain the outbox and exit instead of polling')
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs['batch_size']
+        poll_interval = kwargs['poll_interval']
+        max_attempts = kwargs['max_attempts']
+        claim_timeout = timedelta(seconds=kwargs['claim_timeout'])
+
+        attempt = 0
+        while True:
+            try:
+                indexed, failed = self.drain_batch(batch_size, max_attempts, claim_timeout)
+            except Exception as e:
+                # Elasticsearch or the database being unreachable must not stop the worker, the batch
+                # has been handed back to the outbox and is tried again after a growing pause
+                if kwargs['once']:
+                    raise
+                attempt = attempt + 1
+                delay = backoff(attempt, poll_interval, kwargs['max_backoff'])
+                self.stderr.write(f'Indexing a batch failed ({e}), polling again in {delay} seconds.')
+                time.sleep(delay)
+                continue
+            attempt = 0
+            if indexed or failed:
+                self.stdout.write(f'Indexed {indexed} transactions, {failed} failed.')
+                continue
+            if kwargs['once']:
+                break
+            time.sleep(poll_interval)
+
+    def claim_batch(self, batch_size, max_attempts, claim_timeout):
+        # the row locks are only held while the batch is claimed: pushing next_attempt past the claim
+        # timeout hides the rows from other workers once this transaction commits
+        with transaction.atomic():
+            entries = list(
+                TransactionOutbox.objects.select_for_update(skip_locked=True)
+                .filter(next_attempt__lte=timezone.now(), attempts__lt=max_attempts)
+                .order_by('id')[:batch_size]
+            )
+            claimed_until = timezone.now() + claim_timeout
+            TransactionOutbox.objects.filter(id__in=[e.id for e in entries]).update(next_attempt=claimed_until)
+        return entries, claimed_until
+
+    def drain_batch(self, batch_size, max_attempts, claim_timeout):
+        entries, claimed_until = self.claim_batch(batch_size, max_attempts, claim_timeout)
+        if not entries:
+            return 0, 0
+        entries_by_transaction = {e.transaction_id: e for e in entries}
+
+        indexed_ids = []
+        failed_entries = []
+        try:
+            actions = [
+                {
+                    '_index': index_name,
+                    '_id': str(transaction_id),
+                    '_source': payload,
+                    'pipeline': pipeline_name
+                }
+                for transaction_id, payload in build_records(list(entries_by_transaction))
+            ]
+            # 429s are retried by the bulk helper, anything else waits for the entry's next attempt.
+            # Lost connections are not turned into item failures, they end the batch below
+            for ok, item in streaming_bulk(elasticsearch_client(), actions, chunk_size=batch_size, raise_on_error=False,
+                                           raise_on_exception=False, max_retries=3):
+                result = item['index']
+                entry = entries_by_transaction[int(result['_id'])]
+                if ok:
+                    indexed_ids.append(entry.transaction_id)
+                else:
+                    entry.attempts = entry.attempts + 1
+                    entry.next_attempt = timezone.now() + retry_delay(entry.attempts)
+                    entry.last_error = str(result.get('error'))[:512]
+                    failed_entries.append(entry)
+        except Exception:
+            # hand the whole batch back with its previous next_attempt, documents that did reach the
+            # index are simply indexed again under the same _id
+            TransactionOutbox.objects.bulk_update(entries, ['next_attempt'])
+            raise
+
+        with transaction.atomic():
+            flag_exported(indexed_ids)
+            # an entry saved again while its batch was in flight was re-queued by the posting and stays
+            TransactionOutbox.objects.filter(transaction_id__in=indexed_ids, next_attempt=claimed_until).delete()
+            TransactionOutbox.objects.bulk_update(failed_entries, ['attempts', 'next_attempt', 'last_error'])
+        return len(indexed_ids), len(failed_entries)
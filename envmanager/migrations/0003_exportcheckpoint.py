@@ -0,0 +1,38 @@
+# Generated by Django 5.1.7 on 2026-10-18 13:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('envmanager', '0002_clusterdetail_kibana_url'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=128, unique=True)),
+                ('high_water_mark', models.BigIntegerField(default=0)),
+                ('completed', models.BooleanField(default=False)),
+                ('index_settings', models.JSONField(null=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ExportFailure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_id', models.BigIntegerField()),
+                ('status', models.IntegerField(null=True)),
+                ('error', models.CharField(max_length=512, null=True)),
+                ('checkpoint', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='failures', to='envmanager.exportcheckpoint')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('checkpoint', 'transaction_id'), name='export_failure_transaction')],
+            },
+        ),
+    ]
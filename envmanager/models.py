@@ -10,3 +10,35 @@ class ClusterDetail(models.Model):
     kibana_url = models.CharField(max_length=128, null=True)
     def __str__(self):
         return f"{self.cloud_id}"
+
+
+class ExportCheckpoint(models.Model):
+    name = models.CharField(max_length=128, unique=True)
+    high_water_mark = models.BigIntegerField(null=False, default=0)
+    completed = models.BooleanField(default=False)
+    # settings the index had before a --bulk-load export changed them, kept until they are put back
+    index_settings = models.JSONField(null=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} - {self.high_water_mark}"
+
+    def transient_failures(self, statuses):
+        return list(self.failures.filter(status__in=statuses).order_by('transaction_id').values_list(
+            'transaction_id', flat=True))
+
+
+class ExportFailure(models.Model):
+    # one row per transaction Elasticsearch rejected, removed again once the transaction is indexed
+    checkpoint = models.ForeignKey(ExportCheckpoint, on_delete=models.CASCADE, related_name='failures')
+    transaction_id = models.BigIntegerField(null=False)
+    status = models.IntegerField(null=True)
+    error = models.CharField(max_length=512, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['checkpoint', 'transaction_id'], name='export_failure_transaction'),
+        ]
+
+    def __str__(self):
+        return f"{self.transaction_id} - {self.status}"
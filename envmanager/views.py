@@ -352,10 +352,13 @@ def clear_data(request):
     return render(request, 'envmanager/index.html', context)
 
 
-def run_command():
+def run_command(bulk_load=False):
+    command = ['python', 'manage.py', 'elastic_export']
+    if bulk_load:
+        command.append('--bulk-load')
     # Use subprocess.Popen to run the command and capture output in real-time
     process = subprocess.Popen(
-        ['python', 'manage.py', 'elastic_export'],
+        command,
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
         text=True,
@@ -381,7 +384,7 @@ def read_json_file(file_path):
 def export_data(request):
     if request.POST.get('command_name') == 'elastic_export':
         # Create a StreamingHttpResponse with the generator function
-        response = StreamingHttpResponse(run_command(), content_type="text/plain")
+        response = StreamingHttpResponse(run_command(bool(request.POST.get('bulk_load'))), content_type="text/plain")
 
     else:
         response = 0
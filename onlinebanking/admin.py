@@ -1,7 +1,8 @@
 from django.contrib import admin
 from .models import BankAccountType, BankAccount, Customer, CustomerAddress, AccountTransactionType, AccountTransaction, \
-    TransactionCategory, Retailer, BankingProducts,DemoScenarios
-from envmanager.models import ClusterDetail
+    TransactionCategory, Retailer, BankingProducts, DemoScenarios, GeocodeCache, \
+    TransactionOutbox, AccountMonthlySummary
+from envmanager.models import ClusterDetail, ExportCheckpoint, ExportFailure
 # Register your models here.
 admin.site.register(BankAccountType)
 admin.site.register(BankAccount)
@@ -11,6 +12,11 @@ admin.site.register(AccountTransactionType)
 admin.site.register(AccountTransaction)
 admin.site.register(TransactionCategory)
 admin.site.register(ClusterDetail)
+admin.site.register(ExportCheckpoint)
+admin.site.register(ExportFailure)
 admin.site.register(Retailer)
 admin.site.register(BankingProducts)
-admin.site.register(DemoScenarios)
\ No newline at end of file
+admin.site.register(DemoScenarios)
+admin.site.register(GeocodeCache)
+admin.site.register(TransactionOutbox)
+admin.site.register(AccountMonthlySummary)
@@ -0,0 +1,80 @@
+import csv
+import logging
+
+import googlemaps
+from googlemaps.exceptions import ApiError, HTTPError, Timeout, TransportError
+
+from config import settings
+from .models import GeocodeCache
+
+GOOGLE_MAPS_API_KEY = getattr(settings, 'GOOGLE_MAPS_API_KEY', None)
+GAZETTEER_FILE = settings.BASE_DIR / 'files/gazetteer.csv'
+logger = logging.getLogger('elastic-bank')
+
+# process wide memo of resolved locations, misses are remembered as None so a run never asks twice
+_memo = {}
+_gmaps = None
+
+
+def normalize_location(location):
+    """Returns the cache key for a location, e.g. 'Anchorage, AK ' -> 'anchorage,ak'."""
+    return ','.join(part.strip().lower() for part in location.split(','))
+
+
+def read_gazetteer(file_path=GAZETTEER_FILE):
+    """Yields (location key, latitude, longitude) tuples from the bundled gazetteer."""
+    with open(file_path, newline='') as csvfile:
+        reader = csv.DictReader(csvfile, delimiter=';')
+        for row in reader:
+            location = normalize_location(f"{row['city']},{row['state']}")
+            yield location, float(row['latitude']), float(row['longitude'])
+
+
+def google_geocode(location):
+    # Google errors are left to the caller, only an empty result is a definite miss
+    global _gmaps
+    if not GOOGLE_MAPS_API_KEY:
+        return None
+    if _gmaps is None:
+        _gmaps = googlemaps.Client(key=GOOGLE_MAPS_API_KEY)
+    geocode_result = _gmaps.geocode(location)
+    if not geocode_result:
+        return None
+    coordinates = geocode_result[0]['geometry']['location']
+    return coordinates['lat'], coordinates['lng']
+
+
+def geocode_many(locations):
+    """
+    Resolves a batch of "city,state" strings to (lat, lon) tuples.
+
+    Lookups go to the in-process memo first, then to the GeocodeCache table in one query, and only
+    locations missing from both fall back to Google (when an API key is configured). Google results
+    are written back to the cache. Locations that cannot be resolved map to None, those Google failed
+    on are asked again by the next call.
+    """
+    keys = {location: normalize_location(location) for location in locations}
+    missing = {key for key in keys.values() if key not in _memo}
+    if missing:
+        for entry in GeocodeCache.objects.filter(location__in=missing):
+            _memo[entry.location] = (entry.latitude, entry.longitude)
+            missing.discard(entry.location)
+    for key in missing:
+        try:
+            coordinates = google_geocode(key)
+        except (ApiError, HTTPError, Timeout, TransportError) as e:
+            # not memoized, a temporary failure must not disable the location for the rest of the process
+            logger.warning(f"Google geocoding failed for {key}: {e}")
+            continue
+        _memo[key] = coordinates
+        if coordinates:
+            GeocodeCache.objects.get_or_create(location=key, defaults={
+                'latitude': coordinates[0],
+                'longitude': coordinates[1],
+                'source': 'google'
+            })
+    return {location: _memo.get(key) for location, key in keys.items()}
+
+
+def geocode(location):
+    return geocode_many([location])[location]
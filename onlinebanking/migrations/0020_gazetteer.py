@@ -0,0 +1,40 @@
+import csv
+
+from django.conf import settings
+from django.db import migrations
+
+GAZETTEER_FILE = settings.BASE_DIR / 'files/gazetteer.csv'
+
+
+# a copy of onlinebanking.geocoding.read_gazetteer as it was, so later changes there can't alter this migration
+def read_gazetteer(file_path=GAZETTEER_FILE):
+    with open(file_path, newline='') as csvfile:
+        reader = csv.DictReader(csvfile, delimiter=';')
+        for row in reader:
+            location = ','.join(part.strip().lower() for part in f"{row['city']},{row['state']}".split(','))
+            yield location, float(row['latitude']), float(row['longitude'])
+
+
+def load_gazetteer(apps, schema_editor):
+    geocode_cache = apps.get_model('onlinebanking', 'GeocodeCache')
+    geocode_cache.objects.bulk_create(
+        [geocode_cache(location=location, latitude=latitude, longitude=longitude, source='gazetteer')
+         for location, latitude, longitude in read_gazetteer()],
+        ignore_conflicts=True
+    )
+
+
+def unload_gazetteer(apps, schema_editor):
+    geocode_cache = apps.get_model('onlinebanking', 'GeocodeCache')
+    geocode_cache.objects.filter(source='gazetteer').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onlinebanking', '0019_geocodecache'),
+    ]
+
+    operations = [
+        migrations.RunPython(load_gazetteer, unload_gazetteer),
+    ]
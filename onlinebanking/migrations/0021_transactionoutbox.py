@@ -0,0 +1,26 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:35
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onlinebanking', '0020_gazetteer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.CharField(max_length=512, null=True)),
+                ('transaction', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='outbox_entry', to='onlinebanking.accounttransaction')),
+            ],
+        ),
+    ]
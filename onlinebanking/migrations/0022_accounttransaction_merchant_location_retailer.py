@@ -0,0 +1,39 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onlinebanking', '0021_transactionoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accounttransaction',
+            name='latitude',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='accounttransaction',
+            name='location',
+            field=models.CharField(max_length=128, null=True),
+        ),
+        migrations.AddField(
+            model_name='accounttransaction',
+            name='longitude',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='accounttransaction',
+            name='merchant_name',
+            field=models.CharField(max_length=256, null=True),
+        ),
+        migrations.AddField(
+            model_name='accounttransaction',
+            name='retailer',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='onlinebanking.retailer'),
+        ),
+    ]
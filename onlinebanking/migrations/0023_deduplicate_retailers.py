@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+def deduplicate_retailers(apps, schema_editor):
+    retailer = apps.get_model('onlinebanking', 'Retailer')
+    account_transaction = apps.get_model('onlinebanking', 'AccountTransaction')
+    kept = {}
+    duplicates = {}
+    for retailer_id, name in retailer.objects.order_by('id').values_list('id', 'name'):
+        if name in kept:
+            duplicates.setdefault(kept[name], []).append(retailer_id)
+        else:
+            kept[name] = retailer_id
+    # point purchases at the oldest row of each name before the copies are removed
+    for retailer_id, duplicate_ids in duplicates.items():
+        account_transaction.objects.filter(retailer_id__in=duplicate_ids).update(retailer_id=retailer_id)
+        retailer.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onlinebanking', '0022_accounttransaction_merchant_location_retailer'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_retailers, migrations.RunPython.noop),
+    ]
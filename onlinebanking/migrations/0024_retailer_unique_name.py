@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onlinebanking', '0023_deduplicate_retailers'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='retailer',
+            name='name',
+            field=models.CharField(max_length=256, unique=True),
+        ),
+    ]
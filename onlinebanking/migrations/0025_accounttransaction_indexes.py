@@ -0,0 +1,25 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onlinebanking', '0024_retailer_unique_name'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='accounttransaction',
+            index=models.Index(fields=['bank_account', '-timestamp'], name='transaction_account_timestamp'),
+        ),
+        migrations.AddIndex(
+            model_name='accounttransaction',
+            index=models.Index(fields=['bank_account', '-transaction_date'], name='transaction_account_date'),
+        ),
+        migrations.AddIndex(
+            model_name='accounttransaction',
+            index=models.Index(condition=models.Q(('exported', False)), fields=['id'], name='transaction_unexported'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:57
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def rebuild_balances(apps, schema_editor):
+    # the same expressions as onlinebanking.posting.rebuilt_balances, kept here so the migration doesn't follow it
+    bank_account = apps.get_model('onlinebanking', 'BankAccount')
+    account_transaction = apps.get_model('onlinebanking', 'AccountTransaction')
+    history = account_transaction.objects.filter(bank_account=OuterRef('pk'))
+    latest = history.order_by('-id').values('closing_balance')[:1]
+    posting_count = history.order_by().values('bank_account').annotate(posting_count=Count('id')).values(
+        'posting_count')
+    bank_account.objects.update(
+        current_balance=Coalesce(Subquery(latest), Value(0.0), output_field=models.FloatField()),
+        sequence=Coalesce(Subquery(posting_count), Value(0), output_field=models.BigIntegerField())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onlinebanking', '0025_accounttransaction_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bankaccount',
+            name='current_balance',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='bankaccount',
+            name='sequence',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(rebuild_balances, migrations.RunPython.noop),
+    ]
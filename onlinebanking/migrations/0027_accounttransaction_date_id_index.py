@@ -0,0 +1,21 @@
+# Generated by Django 5.1.7 on 2026-10-18 13:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onlinebanking', '0026_bankaccount_current_balance'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='accounttransaction',
+            name='transaction_account_date',
+        ),
+        migrations.AddIndex(
+            model_name='accounttransaction',
+            index=models.Index(fields=['bank_account', '-transaction_date', '-id'], name='transaction_account_date'),
+        ),
+    ]
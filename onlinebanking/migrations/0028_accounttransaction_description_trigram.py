@@ -0,0 +1,31 @@
+from django.db import migrations
+
+# matches the UPPER(description::text) LIKE UPPER(...) that icontains compiles to on PostgreSQL
+CREATE_INDEX = 'CREATE INDEX IF NOT EXISTS transaction_description_trgm ' \
+               'ON onlinebanking_accounttransaction USING gin (UPPER(description) gin_trgm_ops)'
+DROP_INDEX = 'DROP INDEX IF EXISTS transaction_description_trgm'
+
+
+def create_trigram_index(apps, schema_editor):
+    # trigram indexes are a PostgreSQL extension, other backends keep scanning
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(CREATE_INDEX)
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onlinebanking', '0027_accounttransaction_date_id_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.7 on 2026-10-18 13:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onlinebanking', '0028_accounttransaction_description_trigram'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountMonthlySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('opening_balance', models.FloatField(default=0)),
+                ('closing_balance', models.FloatField(default=0)),
+                ('inflow', models.FloatField(default=0)),
+                ('outflow', models.FloatField(default=0)),
+                ('transaction_count', models.IntegerField(default=0)),
+                ('category_spend', models.JSONField(default=dict)),
+                ('bank_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='onlinebanking.bankaccount')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('bank_account', 'month'), name='summary_account_month')],
+            },
+        ),
+    ]
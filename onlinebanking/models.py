@@ -1,6 +1,7 @@
 import uuid
 
 from django.db import models
+from django.utils import timezone
 
 
 # Create your models here.
@@ -40,6 +41,10 @@ class BankAccount(models.Model):
     account_number = models.CharField(max_length=32, verbose_name='Bank account number')
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, null=False)
     exported = models.BooleanField(default=False)
+    # closing balance of the latest posting and the number of postings, kept up to date by
+    # onlinebanking.posting in the same database transaction as each posting
+    current_balance = models.FloatField(null=False, default=0)
+    sequence = models.BigIntegerField(null=False, default=0)
 
     def __str__(self):
         return self.account_number
@@ -73,13 +78,61 @@ class AccountTransaction(models.Model):
     transaction_category = models.ForeignKey(TransactionCategory, on_delete=models.CASCADE, null=False, default=1)
     transaction_date = models.DateField(null=True)
     exported = models.BooleanField(default=False)
+    merchant_name = models.CharField(max_length=256, null=True)
+    location = models.CharField(max_length=128, null=True)
+    retailer = models.ForeignKey('Retailer', on_delete=models.SET_NULL, null=True)
+    latitude = models.FloatField(null=True)
+    longitude = models.FloatField(null=True)
+
+    class Meta:
+        indexes = [
+            # latest balance of an account
+            models.Index(fields=['bank_account', '-timestamp'], name='transaction_account_timestamp'),
+            # keyset pages of the transactions view, newest first
+            models.Index(fields=['bank_account', '-transaction_date', '-id'], name='transaction_account_date'),
+            # export scan, only created on backends that support partial indexes
+            models.Index(fields=['id'], condition=models.Q(exported=False), name='transaction_unexported'),
+        ]
 
     def __str__(self):
         return f"{self.timestamp} - {self.transaction_value}"
 
 
+class TransactionOutbox(models.Model):
+    transaction = models.OneToOneField(AccountTransaction, on_delete=models.CASCADE, related_name='outbox_entry')
+    created = models.DateTimeField(auto_now_add=True)
+    attempts = models.IntegerField(null=False, default=0)
+    next_attempt = models.DateTimeField(null=False, default=timezone.now)
+    last_error = models.CharField(max_length=512, null=True)
+
+    def __str__(self):
+        return f"{self.transaction_id} - {self.attempts}"
+
+
+class AccountMonthlySummary(models.Model):
+    # one row per account and calendar month, kept up to date by onlinebanking.summaries as
+    # transactions post and rebuilt by the rebuild_monthly_summaries command
+    bank_account = models.ForeignKey(BankAccount, on_delete=models.CASCADE, null=False)
+    month = models.DateField(null=False)
+    opening_balance = models.FloatField(null=False, default=0)
+    closing_balance = models.FloatField(null=False, default=0)
+    inflow = models.FloatField(null=False, default=0)
+    outflow = models.FloatField(null=False, default=0)
+    transaction_count = models.IntegerField(null=False, default=0)
+    # outflow per transaction category name
+    category_spend = models.JSONField(null=False, default=dict)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['bank_account', 'month'], name='summary_account_month'),
+        ]
+
+    def __str__(self):
+        return f"{self.bank_account_id} - {self.month:%Y-%m}"
+
+
 class Retailer(models.Model):
-    name = models.CharField(null=False, max_length=256)
+    name = models.CharField(null=False, max_length=256, unique=True)
     dominant_operational_format = models.CharField(null=True, max_length=256)
 
 
@@ -102,3 +155,13 @@ class DemoScenarios(models.Model):
 
     def __str__(self):
         return self.scenario_name
+
+
+class GeocodeCache(models.Model):
+    location = models.CharField(max_length=128, unique=True)
+    latitude = models.FloatField(null=False)
+    longitude = models.FloatField(null=False)
+    source = models.CharField(max_length=16, null=False, default='gazetteer')
+
+    def __str__(self):
+        return self.location
@@ -0,0 +1,72 @@
+from django.db import models, transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import BankAccount
+from .summaries import update_summaries
+
+
+def lock_accounts(*bank_account_ids):
+    """
+    Locks the given bank accounts with SELECT ... FOR UPDATE until the surrounding atomic block ends
+    and returns them by id. Rows are locked in id order so two postings touching the same accounts
+    always queue up rather than deadlock.
+    """
+    locked = BankAccount.objects.select_for_update().filter(pk__in=set(bank_account_ids)).order_by('pk')
+    return {bank_account.pk: bank_account for bank_account in locked}
+
+
+def apply_posting(bank_account, account_transaction, initial_balance=0):
+    # the caller holds the row lock on bank_account
+    if bank_account.sequence:
+        opening_balance = bank_account.current_balance
+    else:
+        opening_balance = initial_balance
+    if account_transaction.transaction_type.transaction_operator == '-':
+        closing_balance = opening_balance - account_transaction.transaction_value
+    else:
+        closing_balance = opening_balance + account_transaction.transaction_value
+    account_transaction.opening_balance = opening_balance
+    account_transaction.closing_balance = closing_balance
+    account_transaction.save()
+    update_summaries([account_transaction])
+    bank_account.current_balance = closing_balance
+    bank_account.sequence = bank_account.sequence + 1
+    bank_account.save(update_fields=['current_balance', 'sequence'])
+    return account_transaction
+
+
+def post_transaction(account_transaction, initial_balance=0):
+    """
+    Saves a payment or purchase with its opening and closing balance worked out from the account's
+    current_balance, and moves the account's current_balance and sequence in the same database
+    transaction. initial_balance is the opening balance of an account without any posting yet.
+    """
+    with transaction.atomic():
+        bank_account = lock_accounts(account_transaction.bank_account_id)[account_transaction.bank_account_id]
+        return apply_posting(bank_account, account_transaction, initial_balance)
+
+
+def post_transfer(outbound_transaction, inbound_transaction):
+    """
+    Saves both legs of a transfer in one database transaction, with both accounts locked before
+    either balance is read.
+    """
+    with transaction.atomic():
+        locked = lock_accounts(outbound_transaction.bank_account_id, inbound_transaction.bank_account_id)
+        apply_posting(locked[outbound_transaction.bank_account_id], outbound_transaction)
+        apply_posting(locked[inbound_transaction.bank_account_id], inbound_transaction)
+    return outbound_transaction, inbound_transaction
+
+
+def rebuilt_balances(account_transaction_model):
+    """Update expressions that recompute current_balance and sequence from an account's transaction history."""
+    history = account_transaction_model.objects.filter(bank_account=OuterRef('pk'))
+    # ids follow posting order, timestamp is auto_now and moves whenever a row is saved again
+    latest = history.order_by('-id').values('closing_balance')[:1]
+    posting_count = history.order_by().values('bank_account').annotate(posting_count=Count('id')).values(
+        'posting_count')
+    return {
+        'current_balance': Coalesce(Subquery(latest), Value(0.0), output_field=models.FloatField()),
+        'sequence': Coalesce(Subquery(posting_count), Value(0), output_field=models.BigIntegerField())
+    }
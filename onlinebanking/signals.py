@@ -0,0 +1,19 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import AccountTransaction, TransactionOutbox
+
+
+@receiver(post_save, sender=AccountTransaction)
+def enqueue_transaction(sender, instance, update_fields=None, **kwargs):
+    # post_save runs inside the posting's database transaction, so the outbox row commits or rolls back
+    # with it. The transaction_indexer command drains the outbox. Saves that only flip the exported flag
+    # do not need re-indexing.
+    if update_fields and set(update_fields) <= {'exported'}:
+        return
+    TransactionOutbox.objects.update_or_create(transaction=instance, defaults={
+        'attempts': 0,
+        'next_attempt': timezone.now(),
+        'last_error': None
+    })
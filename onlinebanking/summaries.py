@@ -0,0 +1,54 @@
+from datetime import date
+
+from .models import AccountMonthlySummary
+
+SUMMARY_FIELDS = ['opening_balance', 'closing_balance', 'inflow', 'outflow', 'transaction_count', 'category_spend']
+
+
+def month_start(value):
+    """Returns the first day of the month of a date or datetime, the month key of AccountMonthlySummary."""
+    return date(value.year, value.month, 1)
+
+
+def add_posting(summary, account_transaction):
+    # postings must be added in the order they were made so the month's opening balance is the first one's
+    if not summary.transaction_count:
+        summary.opening_balance = account_transaction.opening_balance
+    summary.closing_balance = account_transaction.closing_balance
+    summary.transaction_count = summary.transaction_count + 1
+    if account_transaction.transaction_type.transaction_operator == '-':
+        category_name = account_transaction.transaction_category.category_name
+        summary.outflow = summary.outflow + account_transaction.transaction_value
+        summary.category_spend[category_name] = summary.category_spend.get(category_name, 0) + \
+            account_transaction.transaction_value
+    else:
+        summary.inflow = summary.inflow + account_transaction.transaction_value
+
+
+def update_summaries(account_transactions):
+    """
+    Folds saved transactions into the monthly summaries of their accounts, with one query to read the
+    summaries involved and one bulk write each for new and changed months.
+
+    Callers must keep other writers off the accounts while this runs, the posting service and the
+    dataset generator's ledger both hold the accounts' row locks.
+    """
+    account_transactions = [t for t in account_transactions if t.transaction_date]
+    if not account_transactions:
+        return
+    keys = {(t.bank_account_id, month_start(t.transaction_date)) for t in account_transactions}
+    summaries = {(s.bank_account_id, s.month): s for s in AccountMonthlySummary.objects.filter(
+        bank_account_id__in={account_id for account_id, month in keys}, month__in={month for account_id, month in keys})
+        if (s.bank_account_id, s.month) in keys}
+    changed_summaries = list(summaries.values())
+    new_summaries = []
+    for account_id, month in sorted(keys - summaries.keys()):
+        summaries[(account_id, month)] = AccountMonthlySummary(bank_account_id=account_id, month=month)
+        new_summaries.append(summaries[(account_id, month)])
+
+    for account_transaction in account_transactions:
+        add_posting(summaries[(account_transaction.bank_account_id, month_start(account_transaction.transaction_date))],
+                    account_transaction)
+
+    AccountMonthlySummary.objects.bulk_create(new_summaries)
+    AccountMonthlySummary.objects.bulk_update(changed_summaries, SUMMARY_FIELDS)
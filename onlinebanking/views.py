@@ -1,10 +1,11 @@
-import json
-import googlemaps
 from django.shortcuts import render
 from django.http import HttpResponse
-from .models import BankAccount, AccountTransaction, Customer, Retailer, BankingProducts, DemoScenarios
+from .models import BankAccount, AccountTransaction, AccountTransactionType, AccountMonthlySummary, Customer, \
+    BankingProducts, DemoScenarios
 from .forms import AccountTransactionForm, AccountTransferForm
-from elasticsearch import Elasticsearch
+from .posting import post_transaction, post_transfer
+from .summaries import month_start
+from elasticsearch import Elasticsearch, ApiError, TransportError
 from langchain_community.chat_models import BedrockChat
 from langchain_openai import AzureChatOpenAI
 from dotenv import load_dotenv
@@ -13,7 +14,6 @@ from datetime import datetime, timezone, timedelta
 import tiktoken
 import nltk
 from nltk.tokenize import word_tokenize
-import re
 from config import settings
 import pandas as pd
 from django.db.models import Q
@@ -32,7 +32,6 @@ load_dotenv()
 from langchain.schema import (
     SystemMessage,
     HumanMessage)
-from config.settings import GOOGLE_MAPS_API_KEY
 
 customer_id = getattr(settings, 'DEMO_USER_ID', None)
 index_name = getattr(settings, 'TRANSACTION_INDEX_NAME', None)
@@ -41,6 +40,8 @@ elastic_user = getattr(settings, 'elastic_user', None)
 elastic_password = getattr(settings, 'elastic_password', None)
 model_id = getattr(settings, 'MODEL_ID', None)
 pipeline_name = getattr(settings, 'TRANSACTION_PIPELINE_NAME', None)
+transaction_page_size = getattr(settings, 'TRANSACTION_PAGE_SIZE', 50)
+transaction_search_backend = getattr(settings, 'TRANSACTION_SEARCH_BACKEND', 'database')
 product_index_name = getattr(settings, 'PRODUCT_INDEX', None)
 customer_support_base_index = getattr(settings, 'CUSTOMER_SUPPORT_INDEX', None)
 customer_support_index = f'{customer_support_base_index}_processed'
@@ -169,49 +170,6 @@ def truncate_text(text, max_tokens):
     return trimmed_text
 
 
-def build_record(transaction_id):
-    payload = {}
-    transaction_details = AccountTransaction.objects.filter(id=transaction_id).first()
-    bank_account_details = BankAccount.objects.filter(id=transaction_details.bank_account_id).first()
-    customer_details = Customer.objects.filter(id=bank_account_details.customer_id).first()
-
-    payload = {
-        "transaction_date": transaction_details.transaction_date.strftime("%Y-%m-%d"),
-        "bank_account_number": str(transaction_details.bank_account),
-        "bank_account_type": str(bank_account_details.account_type),
-        "transaction_category": transaction_details.transaction_category.category_name,
-        "transaction_type": transaction_details.transaction_type.transaction_type,
-        "opening_balance": transaction_details.opening_balance,
-        "transaction_value": transaction_details.transaction_value,
-        "closing_balance": transaction_details.closing_balance,
-        "description": transaction_details.description,
-        "customer_name": f'{customer_details.first_name} {customer_details.last_name}',
-        "customer_email": customer_details.email
-    }
-    pattern = r"merchant: (.+?), location: (.+)$"
-    match = re.search(pattern, transaction_details.description)
-    if match:
-        merchant = match.group(1)
-        retailer_format = Retailer.objects.filter(name=merchant).first()
-        payload[
-            'description'] = f"{transaction_details.description} - category: {retailer_format.dominant_operational_format}"
-        payload['merchant_name'] = match.group(1)
-        payload['location'] = match.group(2)
-
-        gmaps = googlemaps.Client(key=GOOGLE_MAPS_API_KEY)
-        geocode_result = gmaps.geocode(payload['location'])
-        location = geocode_result[0]['geometry']['location']
-        latitude = location['lat']
-        longitude = location['lng']
-        payload['geometry'] = {
-            "lat": latitude,
-            "lon": longitude
-        }
-    payload = json.dumps(payload)
-    logger.info(f"Record payload: {payload}")
-    return payload
-
-
 def trim_tokens(text_to_trim):
     llm_token_limit = 10000
     tokens = text_to_trim.split()
@@ -673,95 +631,217 @@ def search(request):
     return render(request, "onlinebanking/search.html", context)
 
 
-def transactions(request, bank_account_id):
-    if request.method == 'POST':
-        keyword = request.POST.get('keyword', '')
-        transaction_list = AccountTransaction.objects.filter(
-            Q(bank_account=bank_account_id) &
-            (Q(description__icontains=keyword) | Q(transaction_date__icontains=keyword))
-        ).order_by('-transaction_date')
+def encode_cursor(account_transaction):
+    return f"{account_transaction.transaction_date.isoformat()}.{account_transaction.id}"
+
+
+def decode_cursor(cursor):
+    """Returns the (transaction_date, id) pair of a page cursor, or None when it is missing or malformed."""
+    try:
+        transaction_date, transaction_id = cursor.split('.')
+        return datetime.strptime(transaction_date, '%Y-%m-%d').date(), int(transaction_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def transaction_page(transaction_list, after=None, before=None, page_size=transaction_page_size):
+    """
+    Returns one page of transactions, newest first, with the cursors of the older and newer pages.
+
+    Pages are cut with a keyset on (transaction_date, id) rather than OFFSET, so every page is an
+    index range scan of page_size + 1 rows however long the account history is. after moves to
+    older transactions and before to newer ones, both are cursors taken from a previous page.
+    """
+    transaction_list = transaction_list.filter(transaction_date__isnull=False)
+    if before:
+        transaction_date, transaction_id = before
+        rows = list(transaction_list.filter(
+            Q(transaction_date__gt=transaction_date) | Q(transaction_date=transaction_date, id__gt=transaction_id)
+        ).order_by('transaction_date', 'id')[:page_size + 1])
+        if len(rows) <= page_size:
+            # back at the newest transactions, show a full first page
+            return transaction_page(transaction_list, page_size=page_size)
+        page = rows[:page_size][::-1]
+        has_newer = True
+        has_older = True
     else:
-        transaction_list = AccountTransaction.objects.filter(bank_account=bank_account_id).order_by(
-            '-transaction_date')
-    context = {
+        if after:
+            transaction_date, transaction_id = after
+            transaction_list = transaction_list.filter(
+                Q(transaction_date__lt=transaction_date) | Q(transaction_date=transaction_date, id__lt=transaction_id))
+        rows = list(transaction_list.order_by('-transaction_date', '-id')[:page_size + 1])
+        has_older = len(rows) > page_size
+        page = rows[:page_size]
+        has_newer = after is not None
+    return {
+        'transaction_list': page,
+        'older_cursor': encode_cursor(page[-1]) if page and has_older else None,
+        'newer_cursor': encode_cursor(page[0]) if page and has_newer else None
+    }
+
+
+def keyword_filter(keyword):
+    """
+    Database keyword search. The description match is served by the transaction_description_trgm
+    trigram index on PostgreSQL, a keyword that is a whole date matches the transaction date.
+    """
+    keyword_query = Q(description__icontains=keyword)
+    try:
+        keyword_query = keyword_query | Q(transaction_date=datetime.strptime(keyword, '%Y-%m-%d').date())
+    except ValueError:
+        pass
+    return keyword_query
+
+
+def search_transactions(bank_account, keyword, page=1, page_size=transaction_page_size):
+    """
+    Searches the transaction index for keyword within one bank account, best match first.
+
+    Returns a page of hits with the description highlighted, and the numbers of the neighbouring
+    pages. Raises the client's ApiError or TransportError when Elasticsearch cannot serve the search.
+    """
+    es = get_es_client()
+    # Elasticsearch refuses from + size beyond index.max_result_window
+    page = max(1, min(page, 10000 // page_size))
+    query = {
+        "bool": {
+            "must": {
+                "match": {
+                    "description": keyword
+                }
+            },
+            "filter": {
+                "term": {
+                    "bank_account_number.keyword": str(bank_account)
+                }
+            }
+        }
+    }
+    highlight = {
+        "encoder": "html",
+        "pre_tags": ["<mark>"],
+        "post_tags": ["</mark>"],
+        "fields": {
+            "description": {
+                "number_of_fragments": 0
+            }
+        }
+    }
+    results = es.options(request_timeout=5).search(
+        index=index_name, query=query, highlight=highlight, sort=["_score", {"transaction_date": "desc"}],
+        from_=(page - 1) * page_size, size=page_size + 1, track_total_hits=False,
+        source=["transaction_date", "description", "transaction_value", "closing_balance"])
+    hits = results['hits']['hits']
+    transaction_list = []
+    for hit in hits[:page_size]:
+        transaction_list.append({
+            'transaction_date': datetime.strptime(hit['_source']['transaction_date'], '%Y-%m-%d').date(),
+            'description': hit['_source']['description'],
+            'highlight': hit.get('highlight', {}).get('description', [None])[0],
+            'transaction_value': hit['_source']['transaction_value'],
+            'closing_balance': hit['_source']['closing_balance']
+        })
+    return {
         'transaction_list': transaction_list,
-        'bank_account_id': bank_account_id
+        'next_page': page + 1 if len(hits) > page_size and page < 10000 // page_size else None,
+        'previous_page': page - 1 if page > 1 else None
     }
+
+
+def transactions(request, bank_account_id):
+    keyword = request.POST.get('keyword', request.GET.get('keyword', ''))
+    context = {
+        'bank_account_id': bank_account_id,
+        'keyword': keyword,
+        'search_backend': transaction_search_backend
+    }
+    bank_account = BankAccount.objects.filter(id=bank_account_id).first()
+    if keyword and bank_account and transaction_search_backend == 'elasticsearch':
+        try:
+            page = int(request.GET.get('page', 1))
+        except ValueError:
+            page = 1
+        try:
+            context.update(search_transactions(bank_account, keyword, page))
+            return render(request, "onlinebanking/transactions.html", context)
+        except (ApiError, TransportError) as e:
+            logger.warning(f"Transaction search falling back to the database: {e}")
+            context['search_backend'] = 'database'
+
+    transaction_list = AccountTransaction.objects.filter(bank_account=bank_account_id)
+    if keyword:
+        transaction_list = transaction_list.filter(keyword_filter(keyword))
+    context.update(transaction_page(transaction_list,
+                                    after=decode_cursor(request.GET.get('after')),
+                                    before=decode_cursor(request.GET.get('before'))))
     return render(request, "onlinebanking/transactions.html", context)
 
 
+def statement(request, bank_account_id):
+    # one summary row per month, the statement never reads the account's transactions
+    bank_account = BankAccount.objects.filter(id=bank_account_id).first()
+    summary_list = AccountMonthlySummary.objects.filter(bank_account=bank_account_id).order_by('-month')
+    context = {
+        'bank_account': bank_account,
+        'bank_account_id': bank_account_id,
+        'summary_list': summary_list
+    }
+    return render(request, "onlinebanking/statement.html", context)
+
+
 def landing(request):
-    demo_user = Customer.objects.filter(id=customer_id).first()
-    # handle the es connection for the map and conversational search components
-    es = get_es_client()
-    # handle any form posting
+    # handle any form posting, new transactions reach Elasticsearch through the outbox and the
+    # transaction_indexer command rather than being exported inline
     if request.method == 'POST':
         payment_form = AccountTransactionForm(request.POST)
         transfer_form = AccountTransferForm(request.POST)
 
         if payment_form.is_valid():
-            # get latest balance
-            latest_transaction = AccountTransaction.objects.filter(
-                bank_account=payment_form.cleaned_data['bank_account']).order_by('-timestamp').first()
-
+            # opening and closing balance come from the account's current_balance
             new_transaction = payment_form.save(commit=False)
-            new_transaction.opening_balance = latest_transaction.closing_balance
             new_transaction.transaction_value = payment_form.cleaned_data['transaction_value']
-            new_transaction.closing_balance = new_transaction.opening_balance - new_transaction.transaction_value
             new_description = f"Payment to {payment_form.cleaned_data['target_bank']} | {payment_form.cleaned_data['target_account']}. {new_transaction.description}"
             new_transaction.description = new_description
             new_transaction.transaction_date = datetime.now(tz=timezone.utc)
-            new_transaction.save()
+            post_transaction(new_transaction)
 
         if transfer_form.is_valid():
-            # work out the closing balance for the source account and save the record
-            latest_transaction_source_account = AccountTransaction.objects.filter(
-                bank_account=payment_form.cleaned_data['bank_account']).order_by('-timestamp').first()
-
+            # the outbound leg is the form's debit against the source account
             new_outbound_transfer = transfer_form.save(commit=False)
-            new_outbound_transfer.opening_balance = latest_transaction_source_account.closing_balance
-            new_outbound_transfer.closing_balance = new_outbound_transfer.opening_balance - new_outbound_transfer.transaction_value
             new_outbound_description = f"Outbound transfer to {transfer_form.cleaned_data['target_account']}. {transfer_form.cleaned_data['description']}"
             new_outbound_transfer.description = new_outbound_description
             new_outbound_transfer.transaction_date = datetime.now(tz=timezone.utc)
 
-            new_outbound_transfer.save()
-
-            # work out the closing balance for the target account and save the record
+            # the inbound leg is a credit against the target account
             new_inbound_transfer = AccountTransaction()
-            latest_transaction_target_account = AccountTransaction.objects.filter(
-                bank_account=transfer_form.cleaned_data['target_account']).order_by('-timestamp').first()
             new_inbound_transfer.transaction_value = transfer_form.cleaned_data['transaction_value']
-            new_inbound_transfer.opening_balance = latest_transaction_target_account.closing_balance
-            new_inbound_transfer.closing_balance = new_inbound_transfer.opening_balance + new_inbound_transfer.transaction_value
             new_inbound_description = f"Inbound transfer from {new_outbound_transfer.bank_account}. {transfer_form.cleaned_data['description']} "
             new_inbound_transfer.description = new_inbound_description
             new_inbound_transfer.bank_account = transfer_form.cleaned_data['target_account']
-            new_inbound_transfer.transaction_type = transfer_form.cleaned_data['transaction_type']
+            new_inbound_transfer.transaction_type = AccountTransactionType.objects.filter(transaction_type='Credit').first()
             new_inbound_transfer.transaction_category = transfer_form.cleaned_data['transaction_category']
             new_inbound_transfer.transaction_date = datetime.now(tz=timezone.utc)
-            new_inbound_transfer.save()
-
-        records_to_import = AccountTransaction.objects.filter(exported=0)
-        for r in records_to_import:
-            payload = build_record(r.id)
-            index_response = es.index(index=index_name, id=r.id, document=payload, pipeline=pipeline_name)
-            r.exported = 1
-            r.save()
+
+            # both legs are posted in one database transaction with both accounts locked
+            post_transfer(new_outbound_transfer, new_inbound_transfer)
+
     payment_form = AccountTransactionForm()
     transfer_form = AccountTransferForm()
-    account_list = BankAccount.objects.filter(customer=customer_id)
+    # accounts without any posting have no balance to show
+    account_list = BankAccount.objects.filter(customer=customer_id, sequence__gt=0)
+    month_summaries = {summary.bank_account_id: summary for summary in AccountMonthlySummary.objects.filter(
+        bank_account__customer=customer_id, month=month_start(datetime.now(tz=timezone.utc)))}
     account_dict_list = []
     for a in account_list:
-        latest_transaction = AccountTransaction.objects.filter(bank_account=a).order_by(
-            '-transaction_date').first()
-        if latest_transaction:
-            account_dict = {
-                'id': a.id,
-                'account_number': a.account_number,
-                'latest_balance': latest_transaction.closing_balance
-            }
-            account_dict_list.append(account_dict)
+        month_summary = month_summaries.get(a.id)
+        account_dict = {
+            'id': a.id,
+            'account_number': a.account_number,
+            'latest_balance': a.current_balance,
+            'month_inflow': month_summary.inflow if month_summary else 0,
+            'month_outflow': month_summary.outflow if month_summary else 0
+        }
+        account_dict_list.append(account_dict)
     context = {
         'account_dict_list': account_dict_list,
         'payment_form': payment_form,